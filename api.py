@@ -1,14 +1,24 @@
 import asyncio
+import functools
 import json
 import logging
+import time
+from collections.abc import Callable, Coroutine, Hashable
+from contextvars import ContextVar
 from typing import Any
+from urllib.parse import urlparse
 
 import aiohttp
 from tenacity import before_sleep_log, retry, retry_if_exception_type, wait_fixed
 
-from botli_dataclasses import API_Challenge_Reponse, Challenge_Request
+from botli_dataclasses import API_Challenge_Reponse, Challenge_Request, Game_State
+from circuit_breaker import Circuit_Breaker
 from config import Config
 from enums import Decline_Reason, Variant
+from game_stream import decode_game_event
+from lag_estimator import Lag_Estimator
+from online_cache import Online_Cache
+from rate_scheduler import Rate_Scheduler
 
 logger = logging.getLogger(__name__)
 BASIC_RETRY_CONDITIONS = {'retry': retry_if_exception_type((aiohttp.ClientError, TimeoutError)),
@@ -22,17 +32,90 @@ GAME_STREAM_RETRY_CONDITIONS = {'retry': retry_if_exception_type((aiohttp.Client
                                                                   TimeoutError)),
                                 'wait': wait_fixed(1.0),
                                 'before_sleep': before_sleep_log(logger, logging.DEBUG)}
+# Seconds between requests that keep the idle connections of the move lane open.
+MOVE_LANE_KEEP_ALIVE_INTERVAL = 30.0
 MOVE_RETRY_CONDITIONS = {'retry': retry_if_exception_type((aiohttp.ClientError, TimeoutError)),
                          'wait': wait_fixed(1.0),
                          'before_sleep': before_sleep_log(logger, logging.DEBUG)}
 
+Online_Request = Callable[..., Coroutine[Any, Any, dict[str, Any] | None]]
+Lichess_Request = Callable[..., Coroutine[Any, Any, Any]]
+# Endpoint class of the running request, read by the trace hooks that detect rate limiting.
+ENDPOINT_CLASS: ContextVar[str | None] = ContextVar('endpoint_class', default=None)
+
+
+def _get_position_key(fen: str) -> str:
+    # Move counters don't change cloud or ChessDB evaluations.
+    return fen.rsplit(' ', 2)[0]
+
+
+def single_flight(source: str, get_key: Callable[..., Hashable]) -> Callable[[Online_Request], Online_Request]:
+    # Concurrent identical lookups, e.g. from several games in the same opening, share one request.
+    def decorator(method: Online_Request) -> Online_Request:
+        @functools.wraps(method)
+        async def wrapper(self: 'API', *args: Any, **kwargs: Any) -> dict[str, Any] | None:
+            key = (source, get_key(*args, **kwargs))
+            if request := self.inflight_requests.get(key):
+                self.coalesced_requests[source] = self.coalesced_requests.get(source, 0) + 1
+                return await asyncio.shield(request)
+
+            request = asyncio.create_task(method(self, *args, **kwargs))
+            self.inflight_requests[key] = request
+            request.add_done_callback(lambda _: self.inflight_requests.pop(key, None))
+            # A cancelled caller must not cancel the request of the others.
+            return await asyncio.shield(request)
+
+        return wrapper
+
+    return decorator
+
+
+def rate_limited(endpoint_class: str) -> Callable[[Lichess_Request], Lichess_Request]:
+    def decorator(method: Lichess_Request) -> Lichess_Request:
+        @functools.wraps(method)
+        async def wrapper(self: 'API', *args: Any, **kwargs: Any) -> Any:
+            if not await self.rate_scheduler.acquire(endpoint_class):
+                return
+
+            token = ENDPOINT_CLASS.set(endpoint_class)
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                ENDPOINT_CLASS.reset(token)
+
+        return wrapper
+
+    return decorator
+
 
 class API:
     def __init__(self, config: Config) -> None:
+        self.lag_estimator = Lag_Estimator()
+        self.rate_scheduler = Rate_Scheduler()
         self.lichess_session = aiohttp.ClientSession(config.url, headers={'Authorization': f'Bearer {config.token}',
                                                                           'User-Agent': f'BotLi/{config.version}'},
-                                                     timeout=aiohttp.ClientTimeout(total=5.0))
+                                                     timeout=aiohttp.ClientTimeout(total=5.0),
+                                                     trace_configs=[self._get_trace_config('default')])
+        # Moves, resignations and aborts get their own connections so they never wait behind other requests.
+        move_connector = aiohttp.TCPConnector(keepalive_timeout=2 * MOVE_LANE_KEEP_ALIVE_INTERVAL)
+        self.move_session = aiohttp.ClientSession(config.url, headers={'Authorization': f'Bearer {config.token}',
+                                                                       'User-Agent': f'BotLi/{config.version}'},
+                                                  connector=move_connector,
+                                                  timeout=aiohttp.ClientTimeout(total=5.0),
+                                                  trace_configs=[self._get_trace_config('move')])
+        self.move_lane_size = max(config.challenge.concurrency, 1)
+        self.game_stream_count = 0
+        self.keep_alive_task: asyncio.Task[None] | None = None
         self.external_session = aiohttp.ClientSession(headers={'User-Agent': f'BotLi/{config.version}'})
+        self.online_cache = Online_Cache(config.online_moves.cache)
+        self.inflight_requests: dict[tuple[str, Hashable], asyncio.Task[dict[str, Any] | None]] = {}
+        self.coalesced_requests: dict[str, int] = {}
+        self.lichess_host = urlparse(config.url).hostname or config.url
+        # Shared by all games, so that an unreachable host doesn't cost every new game its timeouts again.
+        self.circuit_breakers = {host: Circuit_Breaker(host) for host in [self.lichess_host,
+                                                                         'www.chessdb.cn',
+                                                                         'explorer.lichess.ovh',
+                                                                         'tablebase.lichess.ovh']}
 
     async def __aenter__(self) -> 'API':
         return self
@@ -42,16 +125,34 @@ class API:
 
     def append_user_agent(self, username: str) -> None:
         self.lichess_session.headers['User-Agent'] += f' user:{username}'
+        self.move_session.headers['User-Agent'] += f' user:{username}'
         self.external_session.headers['User-Agent'] += f' user:{username}'
 
     async def close(self) -> None:
+        if self.keep_alive_task:
+            self.keep_alive_task.cancel()
+            try:
+                await self.keep_alive_task
+            except asyncio.CancelledError:
+                pass
+
         await self.lichess_session.close()
+        await self.move_session.close()
         await self.external_session.close()
+        await self.online_cache.close()
+
+        if rate_stats := self.rate_scheduler.format_stats():
+            print(f'Rate limited requests: {rate_stats}')
+
+        if self.coalesced_requests:
+            print('Coalesced requests: ' + '     '.join(f'{source}: {count}'
+                                                         for source, count in self.coalesced_requests.items()))
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('move')
     async def abort_game(self, game_id: str) -> bool:
         try:
-            async with self.lichess_session.post(f'/api/bot/game/{game_id}/abort') as response:
+            async with self.move_session.post(f'/api/bot/game/{game_id}/abort') as response:
                 response.raise_for_status()
                 return True
         except aiohttp.ClientResponseError as e:
@@ -59,6 +160,7 @@ class API:
             return False
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('challenge')
     async def accept_challenge(self, challenge_id: str) -> bool:
         async with self.lichess_session.post(f'/api/challenge/{challenge_id}/accept') as response:
             json_response = await response.json()
@@ -68,6 +170,7 @@ class API:
             return True
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('challenge')
     async def cancel_challenge(self, challenge_id: str) -> bool:
         try:
             async with self.lichess_session.post(f'/api/challenge/{challenge_id}/cancel') as response:
@@ -78,6 +181,7 @@ class API:
             return False
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('game')
     async def claim_victory(self, game_id: str) -> bool:
         try:
             async with self.lichess_session.post(f'/api/bot/game/{game_id}/claim-victory') as response:
@@ -87,6 +191,7 @@ class API:
             print(e)
             return False
 
+    @rate_limited('challenge')
     async def create_challenge(self,
                                challenge_request: Challenge_Request,
                                queue: asyncio.Queue[API_Challenge_Reponse]) -> None:
@@ -123,6 +228,7 @@ class API:
             await queue.put(API_Challenge_Reponse(has_timed_out=True))
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('challenge')
     async def decline_challenge(self, challenge_id: str, reason: Decline_Reason) -> bool:
         try:
             async with self.lichess_session.post(f'/api/challenge/{challenge_id}/decline',
@@ -134,6 +240,7 @@ class API:
             return False
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def get_account(self) -> dict[str, Any]:
         async with self.lichess_session.get('/api/account') as response:
             json_response = await response.json()
@@ -143,7 +250,14 @@ class API:
 
             return json_response
 
+    @single_flight('chessdb', lambda fen, timeout: _get_position_key(fen))
     async def get_chessdb_eval(self, fen: str, timeout: int) -> dict[str, Any] | None:
+        if cached_response := await self.online_cache.get('chessdb', {'fen': fen}):
+            return cached_response
+
+        if not self.circuit_breakers['www.chessdb.cn'].allow_request():
+            return
+
         try:
             async with self.external_session.get('http://www.chessdb.cn/cdb.php',
                                                  params={'action': 'queryall',
@@ -151,36 +265,49 @@ class API:
                                                          'json': 1},
                                                  timeout=aiohttp.ClientTimeout(total=timeout)) as response:
                 response.raise_for_status()
-                return await response.json()
+                self.circuit_breakers['www.chessdb.cn'].record_success()
+                json_response = await response.json()
+                if json_response['status'] == 'ok':
+                    await self.online_cache.put('chessdb', {'fen': fen}, json_response)
+                return json_response
         except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            self._record_error('www.chessdb.cn', e)
             print(f'ChessDB: {e}')
-        except TimeoutError:
+        except TimeoutError as e:
+            self._record_error('www.chessdb.cn', e)
             print(f'ChessDB: Timed out after {timeout} second(s).')
 
+    @single_flight('lichess_cloud', lambda fen, variant, timeout: (_get_position_key(fen), variant))
     async def get_cloud_eval(self, fen: str, variant: Variant, timeout: int) -> dict[str, Any] | None:
-        try:
-            async with self.lichess_session.get('/api/cloud-eval', params={'fen': fen, 'variant': variant},
-                                                timeout=aiohttp.ClientTimeout(total=timeout)) as response:
-                if response.status == 404:
-                    return
-                response.raise_for_status()
-                return await response.json()
-        except (aiohttp.ClientError, json.JSONDecodeError) as e:
-            print(f'Cloud: {e}')
-        except TimeoutError:
-            print(f'Cloud: Timed out after {timeout} second(s).')
+        params = {'fen': fen, 'variant': variant}
+        if cached_response := await self.online_cache.get('lichess_cloud', params):
+            return cached_response
+
+        return await self._request_cloud_eval(params, timeout)
 
+    @single_flight('online_egtb', lambda fen, variant, timeout: (fen, variant))
     async def get_egtb(self, fen: str, variant: str, timeout: int) -> dict[str, Any] | None:
+        if cached_response := await self.online_cache.get('online_egtb', {'fen': fen, 'variant': variant}):
+            return cached_response
+
+        if not self.circuit_breakers['tablebase.lichess.ovh'].allow_request():
+            return
+
         try:
             async with self.external_session.get(f'https://tablebase.lichess.ovh/{variant}',
                                                  params={'fen': fen},
                                                  timeout=aiohttp.ClientTimeout(total=timeout)) as response:
 
                 response.raise_for_status()
-                return await response.json()
+                self.circuit_breakers['tablebase.lichess.ovh'].record_success()
+                json_response = await response.json()
+                await self.online_cache.put('online_egtb', {'fen': fen, 'variant': variant}, json_response)
+                return json_response
         except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            self._record_error('tablebase.lichess.ovh', e)
             print(f'EGTB: {e}')
-        except TimeoutError:
+        except TimeoutError as e:
+            self._record_error('tablebase.lichess.ovh', e)
             print(f'EGTB: Timed out after {timeout} second(s).')
 
     @retry(**JSON_RETRY_CONDITIONS)
@@ -192,14 +319,23 @@ class API:
                     await queue.put(json.loads(line))
 
     @retry(**GAME_STREAM_RETRY_CONDITIONS)
-    async def get_game_stream(self, game_id: str, queue: asyncio.Queue[dict[str, Any]]) -> None:
-        async with self.lichess_session.get(f'/api/bot/game/stream/{game_id}',
-                                            timeout=aiohttp.ClientTimeout(sock_connect=5.0)) as response:
-            async for line in response.content:
-                if line.strip():
-                    await queue.put(json.loads(line))
+    async def get_game_stream(self, game_id: str, queue: asyncio.Queue[Game_State | dict[str, Any]]) -> None:
+        # The move lane is only kept open while games are running.
+        self.game_stream_count += 1
+        if self.keep_alive_task is None or self.keep_alive_task.done():
+            self.keep_alive_task = asyncio.create_task(self._keep_move_lane_alive())
+
+        try:
+            async with self.lichess_session.get(f'/api/bot/game/stream/{game_id}',
+                                                timeout=aiohttp.ClientTimeout(sock_connect=5.0)) as response:
+                async for line in response.content:
+                    if line.strip():
+                        queue.put_nowait(decode_game_event(line))
+        finally:
+            self.game_stream_count -= 1
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def get_online_bots(self) -> list[dict[str, Any]]:
         async with self.lichess_session.get('/api/bot/online') as response:
             return [json.loads(line) async for line in response.content if line.strip()]
@@ -218,37 +354,53 @@ class API:
             params['speeds'] = speeds
         if modes:
             params['modes'] = modes
+
+        if cached_response := await self.online_cache.get('opening_explorer', params):
+            return cached_response
+
+        if not self.circuit_breakers['explorer.lichess.ovh'].allow_request():
+            return
+
         try:
             async with self.external_session.get('https://explorer.lichess.ovh/player',
                                                  params=params,
                                                  timeout=aiohttp.ClientTimeout(total=timeout)) as response:
                 response.raise_for_status()
+                self.circuit_breakers['explorer.lichess.ovh'].record_success()
                 async for line in response.content:
                     if line.strip():
-                        return json.loads(line)
+                        json_response = json.loads(line)
+                        await self.online_cache.put('opening_explorer', params, json_response)
+                        return json_response
         except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            self._record_error('explorer.lichess.ovh', e)
             print(f'Explore: {e}')
-        except TimeoutError:
+        except TimeoutError as e:
+            self._record_error('explorer.lichess.ovh', e)
             print(f'Explore: Timed out after {timeout} second(s).')
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def get_token_scopes(self, token: str) -> str:
         async with self.lichess_session.post('/api/token/test', data=token) as response:
             json_response = await response.json()
             return json_response[token]['scopes']
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def get_tournament_info(self, tournament_id: str) -> dict[str, Any]:
         async with self.lichess_session.get(f'/api/tournament/{tournament_id}') as response:
             return await response.json()
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def get_user_status(self, username: str) -> dict[str, Any]:
         async with self.lichess_session.get('/api/users/status', params={'ids': username}) as response:
             json_response = await response.json()
             return json_response[0]
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('game')
     async def handle_takeback(self, game_id: str, accept: bool) -> bool:
         accept_str = 'yes' if accept else 'no'
         async with self.lichess_session.post(f'/api/bot/game/{game_id}/takeback/{accept_str}') as response:
@@ -259,6 +411,7 @@ class API:
             return True
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def join_team(self, team: str, password: str | None) -> bool:
         data = {'password': password} if password else None
         async with self.lichess_session.post(f'/team/{team.lower()}/join', data=data) as response:
@@ -269,6 +422,7 @@ class API:
             return True
 
     @retry(**JSON_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def join_tournament(self, tournament_id: str, team: str | None, password: str | None) -> bool:
         data: dict[str, str] = {}
         if team:
@@ -283,23 +437,30 @@ class API:
             return True
 
     async def queue_chessdb(self, fen: str) -> None:
+        if not self.circuit_breakers['www.chessdb.cn'].allow_request():
+            return
+
         try:
             async with self.external_session.get('http://www.chessdb.cn/cdb.php',
-                                                 params={'action': 'queue', 'board': fen}):
-                pass
+                                                 params={'action': 'queue', 'board': fen}) as response:
+                response.raise_for_status()
+                self.circuit_breakers['www.chessdb.cn'].record_success()
         except aiohttp.ClientError as e:
+            self._record_error('www.chessdb.cn', e)
             print(f'ChessDB Queue: {e}')
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('move')
     async def resign_game(self, game_id: str) -> bool:
         try:
-            async with self.lichess_session.post(f'/api/bot/game/{game_id}/resign') as response:
+            async with self.move_session.post(f'/api/bot/game/{game_id}/resign') as response:
                 response.raise_for_status()
                 return True
         except aiohttp.ClientResponseError as e:
             print(e)
             return False
 
+    @rate_limited('chat')
     async def send_chat_message(self, game_id: str, room: str, text: str) -> bool:
         try:
             async with self.lichess_session.post(f'/api/bot/game/{game_id}/chat',
@@ -311,12 +472,15 @@ class API:
             return False
 
     @retry(**MOVE_RETRY_CONDITIONS)
+    @rate_limited('move')
     async def send_move(self, game_id: str, uci_move: str, offer_draw: bool) -> bool:
         try:
-            async with self.lichess_session.post(f'/api/bot/game/{game_id}/move/{uci_move}',
-                                                 params={'offeringDraw': 'true' if offer_draw else 'false'},
-                                                 timeout=aiohttp.ClientTimeout(total=1.0)) as response:
+            start_time = time.perf_counter()
+            async with self.move_session.post(f'/api/bot/game/{game_id}/move/{uci_move}',
+                                              params={'offeringDraw': 'true' if offer_draw else 'false'},
+                                              timeout=aiohttp.ClientTimeout(total=1.0)) as response:
                 response.raise_for_status()
+                self.lag_estimator.add_round_trip(time.perf_counter() - start_time)
                 return True
         except aiohttp.ClientResponseError as e:
             if 500 <= e.status <= 599:
@@ -326,6 +490,7 @@ class API:
             return False
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def upgrade_account(self) -> bool:
         try:
             async with self.lichess_session.post('/api/bot/account/upgrade') as response:
@@ -336,6 +501,7 @@ class API:
             return False
 
     @retry(**BASIC_RETRY_CONDITIONS)
+    @rate_limited('status')
     async def withdraw_tournament(self, tournament_id: str) -> bool:
         try:
             async with self.lichess_session.post(f'/api/tournament/{tournament_id}/withdraw') as response:
@@ -344,3 +510,71 @@ class API:
         except aiohttp.ClientResponseError as e:
             print(e)
             return False
+
+    def _record_error(self, host: str, error: Exception) -> None:
+        # Only timeouts, failed connections and server errors count, anything else means the host is up.
+        if (isinstance(error, TimeoutError | aiohttp.ClientConnectionError)
+                or isinstance(error, aiohttp.ClientResponseError) and error.status >= 500):
+            self.circuit_breakers[host].record_failure()
+        else:
+            self.circuit_breakers[host].record_success()
+
+    @rate_limited('cloud')
+    async def _request_cloud_eval(self, params: dict[str, Any], timeout: int) -> dict[str, Any] | None:
+        # Only the request itself is rate limited, cache hits neither use up nor wait for tokens.
+        if not self.circuit_breakers[self.lichess_host].allow_request():
+            return
+
+        try:
+            async with self.lichess_session.get('/api/cloud-eval', params=params,
+                                                timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                if response.status == 404:
+                    self.circuit_breakers[self.lichess_host].record_success()
+                    return
+                response.raise_for_status()
+                self.circuit_breakers[self.lichess_host].record_success()
+                json_response = await response.json()
+                await self.online_cache.put('lichess_cloud', params, json_response)
+                return json_response
+        except (aiohttp.ClientError, json.JSONDecodeError) as e:
+            self._record_error(self.lichess_host, e)
+            print(f'Cloud: {e}')
+        except TimeoutError as e:
+            self._record_error(self.lichess_host, e)
+            print(f'Cloud: Timed out after {timeout} second(s).')
+
+    async def _keep_move_lane_alive(self) -> None:
+        # Opens one connection per running game right away and keeps them open, so that the first move
+        # after a pause doesn't pay for the TCP and TLS handshakes.
+        while self.game_stream_count:
+            lane_size = min(self.game_stream_count, self.move_lane_size)
+            await asyncio.gather(*(self._ping_move_lane() for _ in range(lane_size)))
+            await asyncio.sleep(MOVE_LANE_KEEP_ALIVE_INTERVAL)
+
+    @rate_limited('status')
+    async def _ping_move_lane(self) -> None:
+        try:
+            async with self.move_session.head('/api/account') as response:
+                await response.read()
+        except (aiohttp.ClientError, TimeoutError):
+            pass
+
+    def _get_trace_config(self, lane: str) -> aiohttp.TraceConfig:
+        async def on_request_start(_session: aiohttp.ClientSession,
+                                   context: Any,
+                                   _params: aiohttp.TraceRequestStartParams) -> None:
+            context.start_time = time.perf_counter()
+
+        async def on_request_end(_session: aiohttp.ClientSession,
+                                 context: Any,
+                                 params: aiohttp.TraceRequestEndParams) -> None:
+            if params.method == 'POST':
+                self.lag_estimator.add_post_latency(lane, time.perf_counter() - context.start_time)
+
+            if params.response.status == 429 and (endpoint_class := ENDPOINT_CLASS.get()):
+                self.rate_scheduler.pause(endpoint_class)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
@@ -0,0 +1,618 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, replace
+from typing import Any
+
+import chess
+import chess.engine
+import chess.polyglot
+import chess.syzygy
+import psutil
+
+from config import Config
+from configs import Engine_Resources_Config, Limit_Config, Syzygy_Config
+from engine import Engine, Resource_Allocator
+from game_stream import decode_game_event
+from opening_books import Compiled_Book, Opening_Books
+from tablebases import Syzygy_Prober, Tablebases
+
+
+def _format_ms(seconds: float) -> str:
+    return f'{seconds * 1000:8.3f} ms'
+
+
+def _format_us(seconds: float) -> str:
+    return f'{seconds * 1_000_000:8.2f} µs'
+
+
+def _get_mapped_kb(paths: set[str]) -> int:
+    resident = 0
+    for memory_map in psutil.Process().memory_maps(grouped=True):
+        if memory_map.path in paths:
+            resident += memory_map.rss
+
+    return resident // 1024
+
+
+def _get_book_positions(opening_books: Opening_Books, count: int, max_plies: int) -> list[chess.Board]:
+    positions: list[chess.Board] = []
+    readers = list(opening_books.readers.values())
+    while readers and len(positions) < count:
+        reader = random.choice(readers)
+        board = chess.Board()
+        for _ in range(max_plies):
+            positions.append(board.copy(stack=False))
+            entries = list(reader.find_all(board))
+            if not entries:
+                break
+
+            board.push(random.choice(entries).move)
+
+    return positions[:count]
+
+
+def _time_lookups(opening_books: Opening_Books, positions: list[chess.Board]) -> list[float]:
+    lookup_times: list[float] = []
+    for board in positions:
+        for name in opening_books.readers:
+            start_time = time.perf_counter()
+            opening_books.find_all(name, board)
+            lookup_times.append(time.perf_counter() - start_time)
+
+    lookup_times.sort()
+    return lookup_times
+
+
+def _print_percentiles(label: str, times: list[float]) -> None:
+    if not times:
+        return
+
+    print(f'{label + " p50:":36}{_format_us(times[len(times) // 2])}')
+    print(f'{label + " p99:":36}{_format_us(times[int(len(times) * 0.99)])}')
+
+
+def _print_lag_percentiles(lags: list[float]) -> None:
+    if not lags:
+        return
+
+    print(f'{"  Loop lag p50:":36}{_format_ms(lags[len(lags) // 2])}')
+    print(f'{"  Loop lag p99:":36}{_format_ms(lags[int(len(lags) * 0.99)])}')
+    print(f'{"  Loop lag max:":36}{_format_ms(lags[-1])}')
+
+
+def bench_books(config: Config, games: int, lookups: int) -> None:
+    paths = {os.path.realpath(path)
+             for books_config in config.opening_books.books.values()
+             for path in books_config.names.values()}
+    if not paths:
+        print('No opening books configured.')
+        return
+
+    start_time = time.perf_counter()
+    opening_books = Opening_Books(replace(config.opening_books, memory_budget=None))
+    shared_open_time = time.perf_counter() - start_time
+
+    per_game_open_times: list[float] = []
+    for _ in range(games):
+        start_time = time.perf_counter()
+        readers = [chess.polyglot.open_reader(path) for path in paths]
+        per_game_open_times.append(time.perf_counter() - start_time)
+        for reader in readers:
+            reader.close()
+
+    positions = _get_book_positions(opening_books, lookups, 20)
+    cold_kb = _get_mapped_kb(paths)
+    lookup_times = _time_lookups(opening_books, positions)
+    warm_kb = _get_mapped_kb(paths)
+    book_kb = sum(len(reader) for reader in set(opening_books.readers.values())) * 16 // 1024
+    opening_books.close()
+
+    print(f'Books: {len(paths)}     Size: {book_kb} KiB     Positions: {len(positions)}')
+    print(f'Shared registry open (once):        {_format_ms(shared_open_time)}')
+    print(f'Per-game open (x{games}, mean):      {_format_ms(statistics.fmean(per_game_open_times))}')
+    print(f'Per-game open (x{games}, total):     {_format_ms(sum(per_game_open_times))}')
+    _print_percentiles('On-disk lookup', lookup_times)
+    print(f'Resident mapped book pages:         {cold_kb} KiB before lookups, {warm_kb} KiB after')
+
+    if not config.opening_books.memory_budget:
+        return
+
+    start_time = time.perf_counter()
+    opening_books = Opening_Books(config.opening_books)
+    compiled_open_time = time.perf_counter() - start_time
+    compiled_kb = sum(reader.size for reader in set(opening_books.readers.values())
+                      if isinstance(reader, Compiled_Book)) // 1024
+
+    print(f'Compiled registry open (once):      {_format_ms(compiled_open_time)}')
+    _print_percentiles('Compiled lookup', _time_lookups(opening_books, positions))
+    print(f'Compiled book memory:               {compiled_kb} KiB')
+    opening_books.close()
+
+
+def _get_endgame_positions(tablebase: chess.syzygy.Tablebase,
+                           count: int,
+                           min_pieces: int,
+                           max_pieces: int) -> list[chess.Board]:
+    # Fixed seed so that every run probes the same positions.
+    rng = random.Random(0)
+    positions: list[chess.Board] = []
+    for _ in range(count * 1000):
+        if len(positions) >= count:
+            break
+
+        board = chess.Board(None)
+        board.turn = rng.choice(chess.COLORS)
+        pieces = [chess.Piece(chess.KING, chess.WHITE), chess.Piece(chess.KING, chess.BLACK)]
+        pieces += [chess.Piece(rng.choice(chess.PIECE_TYPES[:-1]), rng.choice(chess.COLORS))
+                   for _ in range(rng.randint(min_pieces, max_pieces) - 2)]
+        for piece, square in zip(pieces, rng.sample(chess.SQUARES, len(pieces))):
+            board.set_piece_at(square, piece)
+
+        if not board.is_valid() or board.is_game_over():
+            continue
+
+        try:
+            _probe_children(tablebase, board)
+        except KeyError:
+            continue
+
+        positions.append(board)
+
+    return positions
+
+
+def _probe_children(tablebase: chess.syzygy.Tablebase, board: chess.Board) -> None:
+    for move in board.generate_legal_moves():
+        board.push(move)
+        tablebase.probe_dtz(board)
+        board.pop()
+
+
+async def _time_loop_lag(tablebase: chess.syzygy.Tablebase,
+                         positions: list[chess.Board],
+                         games: int,
+                         executor: ThreadPoolExecutor | None) -> tuple[float, list[float]]:
+    loop = asyncio.get_running_loop()
+    lags: list[float] = []
+
+    async def ticker() -> None:
+        while True:
+            start_time = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start_time - 0.001)
+
+    async def game() -> None:
+        for board in positions:
+            if executor:
+                await loop.run_in_executor(executor, _probe_children, tablebase, board.copy(stack=False))
+            else:
+                _probe_children(tablebase, board.copy(stack=False))
+                await asyncio.sleep(0)
+
+    ticker_task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start_time = time.perf_counter()
+    await asyncio.gather(*(game() for _ in range(games)))
+    elapsed_time = time.perf_counter() - start_time
+    ticker_task.cancel()
+
+    lags.sort()
+    return elapsed_time, lags
+
+
+def bench_probes(config: Config, games: int, positions_count: int) -> None:
+    tablebases = Tablebases(config.syzygy, replace(config.gaviota, enabled=False))
+    if not (tablebase := tablebases.get_syzygy(chess.Board())):
+        print('Standard syzygy tablebases are not enabled for instant play.')
+        return
+
+    positions = _get_endgame_positions(tablebase, positions_count, 3, config.syzygy['standard'].max_pieces)
+    print(f'Games: {games}     Positions: {len(positions)}')
+
+    inline_time, inline_lags = asyncio.run(_time_loop_lag(tablebase, positions, games, None))
+    print(f'{"On the event loop:":36}{_format_ms(inline_time)}')
+    _print_lag_percentiles(inline_lags)
+
+    with ThreadPoolExecutor(games, 'probe') as executor:
+        executor_time, executor_lags = asyncio.run(_time_loop_lag(tablebase, positions, games, executor))
+    print(f'{"In the probe executor:":36}{_format_ms(executor_time)}')
+    _print_lag_percentiles(executor_lags)
+
+    tablebases.close()
+
+
+def bench_syzygy(config: Config, positions_count: int) -> None:
+    tablebases = Tablebases(config.syzygy, replace(config.gaviota, enabled=False))
+    if not (tablebase := tablebases.get_syzygy(chess.Board())):
+        print('Standard syzygy tablebases are not enabled for instant play.')
+        return
+
+    max_pieces = min(config.syzygy['standard'].max_pieces, 7)
+    positions = _get_endgame_positions(tablebase, positions_count, min(5, max_pieces), max_pieces)
+
+    syzygy_prober = Syzygy_Prober(tablebase)
+
+    outcomes = {2: 'Win', 1: 'Win', 0: 'Draw', -1: 'Loss', -2: 'Loss'}
+    stats = {outcome: [0, 0, 0, 0.0, 0.0, 0.0] for outcome in outcomes.values()}
+    for board in positions:
+        moves = list(board.generate_legal_moves())
+
+        start_time = time.perf_counter()
+        _probe_children(tablebase, board.copy(stack=False))
+        dtz_time = time.perf_counter() - start_time
+
+        syzygy_prober.wdls.clear()
+        syzygy_prober.dtzs.clear()
+        start_time = time.perf_counter()
+        result = syzygy_prober.probe_root(board.copy(stack=False), moves)
+        wdl_first_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        syzygy_prober.probe_root(board.copy(stack=False), moves)
+        memoized_time = time.perf_counter() - start_time
+
+        outcome_stats = stats[outcomes[result.wdl]]
+        outcome_stats[0] += 1
+        outcome_stats[1] += len(moves)
+        outcome_stats[2] += len(syzygy_prober.dtzs)
+        outcome_stats[3] += dtz_time
+        outcome_stats[4] += wdl_first_time
+        outcome_stats[5] += memoized_time
+
+    print(f'Positions: {len(positions)}     Pieces: {min(5, max_pieces)}-{max_pieces}')
+    print(f'{"Outcome":10}{"Positions":>10}{"DTZ probes":>18}{"DTZ for all":>16}{"WDL first":>16}{"Memoized":>16}')
+    for outcome, (count, moves_count, dtz_count, dtz_time, wdl_first_time, memoized_time) in stats.items():
+        if count:
+            print(f'{outcome:10}{count:10}{f"{moves_count} -> {dtz_count}":>18}'
+                  f'{_format_ms(dtz_time):>16}{_format_ms(wdl_first_time):>16}{_format_ms(memoized_time):>16}')
+
+    tablebases.close()
+
+
+async def _time_engine_moves(engine: Engine, moves_count: int) -> tuple[float, int]:
+    board = chess.Board()
+    cpu_time = 0.0
+    nps = 0
+    for _ in range(moves_count):
+        if board.is_game_over():
+            board = chess.Board()
+
+        start_time = time.process_time()
+        move, info = await engine.make_move(board, 60.0, 60.0, 0.0)
+        cpu_time += time.process_time() - start_time
+        nps += info.get('nps', 0)
+        board.push(move)
+
+    return cpu_time, nps // moves_count
+
+
+def bench_engine_info(config: Config, engine_key: str, moves_count: int, move_time: float) -> None:
+    if engine_key not in config.engines:
+        print(f'Engine "{engine_key}" is not configured.')
+        return
+
+    limits = replace(config.engines[engine_key].limits, time=move_time, depth=None, nodes=None)
+    print(f'Engine: {engine_key}     Moves: {moves_count}     Move time: {move_time:.1f} s')
+    print(f'{"Info level":12}{"Loop CPU per move":>20}{"Avg NPS":>16}')
+    for info_level in ['all', 'final']:
+        engine_config = replace(config.engines[engine_key], ponder=False, info_level=info_level, limits=limits)
+
+        async def run() -> tuple[float, int]:
+            engine = await Engine.from_config(engine_config, Syzygy_Config(False, [], 0, False, 0),
+                                              chess.engine.Opponent(None, None, None, False))
+            try:
+                return await _time_engine_moves(engine, moves_count)
+            finally:
+                await engine.close()
+
+        cpu_time, nps = asyncio.run(run())
+        print(f'{info_level:12}{_format_ms(cpu_time / moves_count):>20}{nps:>16,}')
+
+
+async def _get_nps_values(engine: Engine, moves_count: int) -> list[int]:
+    board = chess.Board()
+    nps_values: list[int] = []
+    for _ in range(moves_count):
+        if board.is_game_over():
+            board = chess.Board()
+
+        move, info = await engine.make_move(board, 60.0, 60.0, 0.0)
+        if nps := info.get('nps'):
+            nps_values.append(nps)
+        board.push(move)
+
+    return nps_values
+
+
+def bench_pinning(config: Config, engine_key: str, games: int, moves_count: int, move_time: float) -> None:
+    if engine_key not in config.engines:
+        print(f'Engine "{engine_key}" is not configured.')
+        return
+
+    limits = replace(config.engines[engine_key].limits, time=move_time, depth=None, nodes=None)
+    engine_config = replace(config.engines[engine_key], ponder=False, limits=limits)
+    print(f'Engine: {engine_key}     Games: {games}     Moves: {moves_count}     Move time: {move_time:.1f} s')
+
+    async def run(allocator: Resource_Allocator) -> list[list[int]]:
+        engines = [await Engine.from_config(engine_config, Syzygy_Config(False, [], 0, False, 0),
+                                            chess.engine.Opponent(None, None, None, False))
+                   for _ in range(games)]
+        try:
+            for engine in engines:
+                await allocator.add(engine, engine_config, 60_000, 0)
+            return await asyncio.gather(*(_get_nps_values(engine, moves_count) for engine in engines))
+        finally:
+            for engine in engines:
+                allocator.remove(engine)
+                await engine.close()
+
+    # The unpinned run goes first as pinning also restricts the benchmark process to its core.
+    results = {'unpinned': asyncio.run(run(Resource_Allocator(Engine_Resources_Config(False, 0, 0, False))))}
+    allocator = Resource_Allocator(Engine_Resources_Config(False, 0, 0, True))
+    if allocator.cores:
+        results['pinned'] = asyncio.run(run(allocator))
+
+    print(f'{"Placement":12}{"Mean NPS":>14}{"NPS stdev":>14}{"Move CV":>10}{"Game spread":>14}')
+    for placement, nps_values in results.items():
+        all_values = [nps for game_values in nps_values for nps in game_values]
+        game_means = [statistics.fmean(game_values) for game_values in nps_values if game_values]
+        if len(all_values) < 2 or not game_means:
+            print(f'{placement:12}{"no NPS reported":>14}')
+            continue
+
+        mean = statistics.fmean(all_values)
+        stdev = statistics.stdev(all_values)
+        # Difference between the fastest and the slowest game relative to the mean NPS.
+        spread = (max(game_means) - min(game_means)) / mean
+        print(f'{placement:12}{mean:>14,.0f}{stdev:>14,.0f}{stdev / mean:>10.1%}{spread:>14.1%}')
+
+
+def _get_game_stream_lines(stream_path: str | None, plies: int) -> list[bytes]:
+    if stream_path:
+        with open(stream_path, 'rb') as stream_file:
+            return [line for line in stream_file if line.strip()]
+
+    # Without a recording, a random game is streamed the way lichess sends it.
+    board = chess.Board()
+    lines = [json.dumps({'type': 'gameFull', 'id': 'benchmark', 'state': {'type': 'gameState', 'moves': ''}},
+                        separators=(',', ':')).encode()]
+    for ply in range(plies):
+        if board.is_game_over():
+            board = chess.Board()
+
+        board.push(random.choice(list(board.legal_moves)))
+        lines.append(json.dumps({'type': 'gameState',
+                                 'moves': ' '.join(move.uci() for move in board.move_stack),
+                                 'wtime': 180_000 - ply * 500,
+                                 'btime': 180_000 - ply * 400,
+                                 'winc': 2000,
+                                 'binc': 2000,
+                                 'status': 'started'}, separators=(',', ':')).encode())
+
+    return lines
+
+
+def bench_game_stream(stream_path: str | None, plies: int, rounds: int) -> None:
+    lines = _get_game_stream_lines(stream_path, plies)
+    average_length = sum(len(line) for line in lines) / len(lines)
+    print(f'Events: {len(lines)}     Average length: {average_length:.0f} bytes     Rounds: {rounds}')
+    print(f'{"Decoder":16}{"Time per event":>18}{"Events/s":>14}')
+    for name, decoder in [('json.loads', json.loads), ('decode_game_event', decode_game_event)]:
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            for line in lines:
+                decoder(line)
+        event_time = (time.perf_counter() - start_time) / (rounds * len(lines))
+
+        print(f'{name:16}{_format_us(event_time):>18}{1 / event_time:>14,.0f}')
+
+
+def _read_epd(epd_path: str) -> list[tuple[str, chess.Board]]:
+    positions: list[tuple[str, chess.Board]] = []
+    with open(epd_path, encoding='utf-8') as epd_file:
+        for line in epd_file:
+            if not line.strip():
+                continue
+
+            board = chess.Board()
+            operations = board.set_epd(line)
+            positions.append((str(operations.get('id', board.fen())), board))
+
+    return positions
+
+
+async def _play_suite(engine: Engine,
+                      opponent: Engine,
+                      positions: list[tuple[str, chess.Board]],
+                      plies: int,
+                      clock: float,
+                      increment: float) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    for position_id, board in positions:
+        await engine.new_game()
+        await opponent.new_game()
+        own_color = board.turn
+        clocks = {chess.WHITE: clock, chess.BLACK: clock}
+
+        for ply in range(plies):
+            if board.is_game_over():
+                break
+
+            if board.turn != own_color:
+                move, _ = await opponent.make_move(board, clocks[chess.WHITE], clocks[chess.BLACK], increment)
+                board.push(move)
+                continue
+
+            is_game_start = len(board.move_stack) < 2
+            ponderhit_count = engine.ponderhit_count
+            own_clock = clocks[board.turn]
+
+            start_time = time.perf_counter()
+            move, info = await engine.make_move(board, clocks[chess.WHITE], clocks[chess.BLACK], increment)
+            think_time = time.perf_counter() - start_time
+
+            # Like on lichess the clocks only start after both players made their first move.
+            if not is_game_start:
+                clocks[board.turn] += increment - think_time
+
+            results.append({'position': position_id,
+                            'ply': ply,
+                            'move': move.uci(),
+                            'game_start': is_game_start,
+                            'clock': own_clock,
+                            'requested_time': engine.limit_config.time,
+                            'think_time': think_time,
+                            'engine_time': info.get('time'),
+                            'ponderhit': engine.ponderhit_count > ponderhit_count,
+                            'depth': info.get('depth'),
+                            'nodes': info.get('nodes'),
+                            'nps': info.get('nps'),
+                            'hashfull': info.get('hashfull')})
+            board.push(move)
+
+    return results
+
+
+def _get_suite_summary(results: list[dict[str, Any]], engine: Engine) -> dict[str, Any]:
+    moves = [result for result in results if not result['game_start']]
+    think_times = sorted(result['think_time'] for result in moves)
+    # After a ponderhit the engine reports the time of the whole search including the pondering.
+    overheads = [result['think_time'] - result['engine_time'] for result in moves
+                 if result['engine_time'] and not result['ponderhit']]
+    time_gaps = [result['think_time'] - result['requested_time'] for result in moves if result['requested_time']]
+    nps_values = [result['nps'] for result in moves if result['nps']]
+    hashfull_values = [result['hashfull'] for result in moves if result['hashfull'] is not None]
+
+    return {'moves': len(moves),
+            'think_time_p50': think_times[len(think_times) // 2] if think_times else None,
+            'think_time_p95': think_times[int(len(think_times) * 0.95)] if think_times else None,
+            'think_time_max': think_times[-1] if think_times else None,
+            'wrapper_overhead_mean': statistics.fmean(overheads) if overheads else None,
+            'requested_time_gap_mean': statistics.fmean(time_gaps) if time_gaps else None,
+            'ponderhit_rate': engine.ponderhit_count / engine.ponder_count if engine.ponder_count else None,
+            'nps_mean': round(statistics.fmean(nps_values)) if nps_values else None,
+            'hashfull_max': max(hashfull_values) if hashfull_values else None,
+            'min_clock': min((result['clock'] for result in moves), default=None)}
+
+
+def bench_engine(config: Config,
+                 engine_key: str,
+                 epd_path: str,
+                 plies: int,
+                 clock: float,
+                 increment: float,
+                 opponent_time: float,
+                 output_path: str) -> None:
+    if engine_key not in config.engines:
+        print(f'Engine "{engine_key}" is not configured.')
+        return
+
+    engine_config = config.engines[engine_key]
+    opponent_config = replace(engine_config, ponder=False, limits=Limit_Config(opponent_time, None, None))
+    positions = _read_epd(epd_path)
+    syzygy_config = config.syzygy.get('standard', Syzygy_Config(False, [], 0, False, 0))
+
+    async def run() -> tuple[str, list[dict[str, Any]], dict[str, Any]]:
+        # Human opponents keep the fixed time of the first two moves short.
+        engine = await Engine.from_config(engine_config, syzygy_config, chess.engine.Opponent(None, None, None, False))
+        opponent = await Engine.from_config(opponent_config, Syzygy_Config(False, [], 0, False, 0),
+                                            chess.engine.Opponent(None, None, None, False))
+        try:
+            results = await _play_suite(engine, opponent, positions, plies, clock, increment)
+            return engine.name, results, _get_suite_summary(results, engine)
+        finally:
+            await engine.close()
+            await opponent.close()
+
+    engine_name, results, summary = asyncio.run(run())
+
+    with open(output_path, 'w', encoding='utf-8') as output:
+        json.dump({'engine': engine_name,
+                   'engine_key': engine_key,
+                   'uci_options': engine_config.uci_options,
+                   'limits': asdict(engine_config.limits),
+                   'ponder': engine_config.ponder,
+                   'epd': epd_path,
+                   'plies': plies,
+                   'clock': clock,
+                   'increment': increment,
+                   'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   'summary': summary,
+                   'moves': results}, output, indent=2)
+
+    print(f'Engine: {engine_name}     Positions: {len(positions)}     Moves: {summary["moves"]}')
+    for name, value in summary.items():
+        if isinstance(value, float):
+            print(f'{name + ":":36}{value:12.3f}')
+        else:
+            print(f'{name + ":":36}{value!s:>12}')
+    print(f'Results written to "{output_path}".')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', '-c', default='config.yml', help='Path to config.yml.')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    books_parser = subparsers.add_parser('books', help='Opening book open and lookup latency.')
+    books_parser.add_argument('--games', type=int, default=32, help='Number of simulated game starts.')
+    books_parser.add_argument('--lookups', type=int, default=2000, help='Number of looked up positions.')
+
+    probes_parser = subparsers.add_parser('probes', help='Event loop lag while games probe tablebases.')
+    probes_parser.add_argument('--games', type=int, default=4, help='Number of simultaneously probing games.')
+    probes_parser.add_argument('--positions', type=int, default=50, help='Number of probed positions per game.')
+
+    syzygy_parser = subparsers.add_parser('syzygy', help='Syzygy root probing time with and without WDL first.')
+    syzygy_parser.add_argument('--positions', type=int, default=200, help='Number of probed positions.')
+
+    engine_info_parser = subparsers.add_parser('engine-info', help='Loop CPU time per move for each info level.')
+    engine_info_parser.add_argument('--engine', default='standard', help='Key of the configured engine.')
+    engine_info_parser.add_argument('--moves', type=int, default=20, help='Number of moves per info level.')
+    engine_info_parser.add_argument('--move-time', type=float, default=1.0, help='Search time per move in seconds.')
+
+    pinning_parser = subparsers.add_parser('pinning',
+                                           help='NPS variance of simultaneous games with and without pinning.')
+    pinning_parser.add_argument('--engine', default='standard', help='Key of the configured engine.')
+    pinning_parser.add_argument('--games', type=int, default=2, help='Number of simultaneously running engines.')
+    pinning_parser.add_argument('--moves', type=int, default=20, help='Number of moves per engine.')
+    pinning_parser.add_argument('--move-time', type=float, default=1.0, help='Search time per move in seconds.')
+
+    game_stream_parser = subparsers.add_parser('game-stream', help='Decoding speed of game stream events.')
+    game_stream_parser.add_argument('--stream', help='Recorded game stream, one event per line. (default: random game)')
+    game_stream_parser.add_argument('--plies', type=int, default=200, help='Number of plies of the random game.')
+    game_stream_parser.add_argument('--rounds', type=int, default=200, help='Number of times the stream is decoded.')
+
+    engine_parser = subparsers.add_parser('engine', help='Engine behaviour on a position suite with simulated clocks.')
+    engine_parser.add_argument('--engine', default='standard', help='Key of the configured engine.')
+    engine_parser.add_argument('--epd', default='bench.epd', help='Path to the EPD position suite.')
+    engine_parser.add_argument('--plies', type=int, default=8, help='Number of plies played from each position.')
+    engine_parser.add_argument('--clock', type=float, default=60.0, help='Initial clock in seconds.')
+    engine_parser.add_argument('--increment', type=float, default=1.0, help='Increment in seconds.')
+    engine_parser.add_argument('--opponent-time', type=float, default=0.1, help='Search time per opponent move.')
+    engine_parser.add_argument('--output', '-o', default='engine_bench.json', help='Path of the JSON results.')
+
+    args = parser.parse_args()
+    config = Config.from_yaml(args.config)
+
+    match args.benchmark:
+        case 'books':
+            bench_books(config, args.games, args.lookups)
+        case 'probes':
+            bench_probes(config, args.games, args.positions)
+        case 'syzygy':
+            bench_syzygy(config, args.positions)
+        case 'engine-info':
+            bench_engine_info(config, args.engine, args.moves, args.move_time)
+        case 'pinning':
+            bench_pinning(config, args.engine, args.games, args.moves, args.move_time)
+        case 'game-stream':
+            bench_game_stream(args.stream, args.plies, args.rounds)
+        case 'engine':
+            bench_engine(config, args.engine, args.epd, args.plies, args.clock, args.increment, args.opponent_time,
+                         args.output)
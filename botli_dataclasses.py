@@ -5,7 +5,6 @@ from typing import Any, Literal
 
 import chess
 import chess.engine
-from chess.polyglot import MemoryMappedReader
 
 from enums import Challenge_Color, Perf_Type, Variant
 
@@ -26,7 +25,7 @@ class API_Challenge_Reponse:
 class Book_Settings:
     selection: Literal['weighted_random', 'uniform_random', 'best_move'] = 'best_move'
     max_depth: int | None = None
-    readers: dict[str, MemoryMappedReader] = field(default_factory=dict)
+    names: list[str] = field(default_factory=list)
 
 
 @dataclass
@@ -94,6 +93,23 @@ class Chat_Message:
         return cls(username, text, room)
 
 
+@dataclass(slots=True)
+class Game_State:
+    moves: str
+    wtime: int
+    btime: int
+    status: str
+    winner: str | None = None
+    wtakeback: bool = False
+    btakeback: bool = False
+
+    @classmethod
+    def from_gameState_event(cls, gameState_event: dict[str, Any]) -> 'Game_State':
+        return cls(gameState_event['moves'], gameState_event['wtime'], gameState_event['btime'],
+                   gameState_event['status'], gameState_event.get('winner'),
+                   gameState_event.get('wtakeback', False), gameState_event.get('btakeback', False))
+
+
 @dataclass(frozen=True)
 class Game_Information:
     id_: str
@@ -114,7 +130,7 @@ class Game_Information:
     variant: Variant
     variant_name: str
     initial_fen: str
-    state: dict[str, Any]
+    state: Game_State
     tournament_id: str | None
 
     @classmethod
@@ -139,7 +155,7 @@ class Game_Information:
         variant = Variant(gameFull_event['variant']['key'])
         variant_name = gameFull_event['variant']['name']
         initial_fen = gameFull_event['initialFen']
-        state = gameFull_event['state']
+        state = Game_State.from_gameState_event(gameFull_event['state'])
         tournament_id = gameFull_event.get('tournamentId')
 
         return cls(id_, white_title, white_name, white_rating, white_ai_level, white_provisional, black_title,
@@ -0,0 +1,74 @@
+import time
+
+FAILURE_THRESHOLD = 3
+COOLDOWN = 60.0
+PROBE_SUCCESSES = 2
+
+
+class Circuit_Breaker:
+    def __init__(self, host: str) -> None:
+        self.host = host
+        self.failures = 0
+        self.opened_time: float | None = None
+        self.probe_time: float | None = None
+        self.successful_probes = 0
+        self.short_circuits = 0
+
+    @property
+    def is_open(self) -> bool:
+        # Unlike allow_request, this neither counts a skipped request nor starts a probe.
+        if self.opened_time is None:
+            return False
+
+        now = time.monotonic()
+        if now - self.opened_time < COOLDOWN:
+            return True
+
+        return self.probe_time is not None and now - self.probe_time < COOLDOWN
+
+    def allow_request(self) -> bool:
+        if self.opened_time is None:
+            return True
+
+        now = time.monotonic()
+        if now - self.opened_time < COOLDOWN:
+            self.short_circuits += 1
+            return False
+
+        # Half open: a single probe at a time. A probe whose caller got cancelled stops blocking after the cooldown.
+        if self.probe_time is not None and now - self.probe_time < COOLDOWN:
+            self.short_circuits += 1
+            return False
+
+        self.probe_time = now
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_time is None:
+            self.failures = 0
+            return
+
+        # Only the half open probe counts, not requests that were already in flight when the breaker opened.
+        if self.probe_time is None or time.monotonic() - self.opened_time < COOLDOWN:
+            return
+
+        self.probe_time = None
+        self.successful_probes += 1
+        if self.successful_probes >= PROBE_SUCCESSES:
+            print(f'{self.host}: Responding again after {self.short_circuits} skipped request(s).')
+            self.failures = 0
+            self.opened_time = None
+            self.successful_probes = 0
+            self.short_circuits = 0
+
+    def record_failure(self) -> None:
+        if self.opened_time is not None:
+            self.opened_time = time.monotonic()
+            self.probe_time = None
+            self.successful_probes = 0
+            return
+
+        self.failures += 1
+        if self.failures >= FAILURE_THRESHOLD:
+            print(f'{self.host}: Skipping requests for {COOLDOWN:.0f} seconds after {self.failures} failures.')
+            self.opened_time = time.monotonic()
@@ -7,10 +7,11 @@ from typing import Any
 
 import yaml
 
-from configs import (Books_Config, Challenge_Config, ChessDB_Config, Engine_Config, Gaviota_Config,
-                     Lichess_Cloud_Config, Limit_Config, Matchmaking_Config, Matchmaking_Type_Config, Messages_Config,
-                     Offer_Draw_Config, Online_EGTB_Config, Online_Moves_Config, Opening_Books_Config,
-                     Opening_Explorer_Config, Resign_Config, Syzygy_Config)
+from configs import (Books_Config, Challenge_Config, ChessDB_Config, Engine_Config, Engine_Pool_Config,
+                     Engine_Resources_Config, Gaviota_Config, Lichess_Cloud_Config, Limit_Config, Matchmaking_Config,
+                     Matchmaking_Type_Config, Messages_Config, Offer_Draw_Config, Online_Cache_Config,
+                     Online_EGTB_Config, Online_Moves_Config, Opening_Books_Config, Opening_Explorer_Config,
+                     Resign_Config, Syzygy_Config)
 
 
 @dataclass
@@ -18,6 +19,8 @@ class Config:
     url: str
     token: str
     engines: dict[str, Engine_Config]
+    engine_pool: Engine_Pool_Config
+    engine_resources: Engine_Resources_Config
     syzygy: dict[str, Syzygy_Config]
     gaviota: Gaviota_Config
     opening_books: Opening_Books_Config
@@ -46,6 +49,8 @@ class Config:
         cls._check_sections(yaml_config)
 
         engine_configs = cls._get_engine_configs(yaml_config['engines'])
+        engine_pool_config = cls._get_engine_pool_config(yaml_config.get('engine_pool') or {})
+        engine_resources_config = cls._get_engine_resources_config(yaml_config.get('engine_resources') or {})
         syzygy_config = cls._get_syzygy_configs(yaml_config['syzygy'])
         gaviota_config = cls._get_gaviota_config(yaml_config['gaviota'])
         opening_books_config = cls._get_opening_books_config(yaml_config)
@@ -61,6 +66,8 @@ class Config:
         return cls(yaml_config.get('url', 'https://lichess.org'),
                    yaml_config['token'],
                    engine_configs,
+                   engine_pool_config,
+                   engine_resources_config,
                    syzygy_config,
                    gaviota_config,
                    opening_books_config,
@@ -114,30 +121,47 @@ class Config:
 
         engine_configs: dict[str, Engine_Config] = {}
         for key, settings in engines_section.items():
+            remote = settings.get('remote')
             for subsection in engines_sections:
+                if remote and subsection[0] in ['dir', 'name']:
+                    continue
+
                 if subsection[0] not in settings:
                     raise RuntimeError(f'Your "{key}" engine does not have required field `{subsection[0]}`.')
 
                 if not isinstance(settings[subsection[0]], subsection[1]):
                     raise TypeError(f'`engines` `{key}` subsection {subsection[2]}')
 
-            if not os.path.isdir(settings['dir']):
-                raise RuntimeError(f'Your engine dir "{settings["dir"]}" is not a directory.')
+            if remote:
+                if not isinstance(remote, str) or not remote.startswith(('tcp://', 'unix://')):
+                    raise RuntimeError(f'`engines` `{key}` subsection "remote" must be '
+                                       '"tcp://HOST:PORT" or "unix:///PATH" wrapped in quotes.')
+
+                settings['path'] = remote
+            else:
+                if not os.path.isdir(settings['dir']):
+                    raise RuntimeError(f'Your engine dir "{settings["dir"]}" is not a directory.')
 
-            settings['path'] = os.path.join(settings['dir'], settings['name'])
+                settings['path'] = os.path.join(settings['dir'], settings['name'])
 
-            if not os.path.isfile(settings['path']):
-                raise RuntimeError(f'The engine "{settings["path"]}" file does not exist.')
+                if not os.path.isfile(settings['path']):
+                    raise RuntimeError(f'The engine "{settings["path"]}" file does not exist.')
 
-            if not os.access(settings['path'], os.X_OK):
-                raise RuntimeError(f'The engine "{settings["path"]}" doesnt have execute (x) permission. '
-                                   f'Try: chmod +x {settings["path"]}')
+                if not os.access(settings['path'], os.X_OK):
+                    raise RuntimeError(f'The engine "{settings["path"]}" doesnt have execute (x) permission. '
+                                       f'Try: chmod +x {settings["path"]}')
+
+            info_level = settings.get('info_level', 'all')
+            if info_level not in ['all', 'final']:
+                raise RuntimeError(f'`engines` `{key}` subsection "info_level" must be "all" or "final".')
 
             limits_settings = settings['limits'] or {}
 
             engine_configs[key] = Engine_Config(settings['path'],
+                                                bool(remote),
                                                 settings['ponder'],
                                                 settings['silence_stderr'],
+                                                info_level,
                                                 settings['move_overhead_multiplier'],
                                                 settings['uci_options'] or {},
                                                 Limit_Config(limits_settings.get('time'),
@@ -146,6 +170,44 @@ class Config:
 
         return engine_configs
 
+    @staticmethod
+    def _get_engine_pool_config(engine_pool_section: dict[str, Any]) -> Engine_Pool_Config:
+        if not isinstance(engine_pool_section, dict):
+            raise TypeError('Section `engine_pool` must be a dictionary with indented keys followed by colons.')
+
+        engine_pool_sections = [
+            ['size', int, '"size" must be an integer.'],
+            ['max_reuse', int, '"max_reuse" must be an integer.']]
+
+        for subsection in engine_pool_sections:
+            if not isinstance(engine_pool_section.get(subsection[0], 0), subsection[1]):
+                raise TypeError(f'`engine_pool` subsection {subsection[2]}')
+
+        return Engine_Pool_Config(engine_pool_section.get('size', 0), engine_pool_section.get('max_reuse', 20))
+
+    @staticmethod
+    def _get_engine_resources_config(engine_resources_section: dict[str, Any]) -> Engine_Resources_Config:
+        if not isinstance(engine_resources_section, dict):
+            raise TypeError('Section `engine_resources` must be a dictionary with indented keys followed by colons.')
+
+        engine_resources_sections = [
+            ['enabled', bool, '"enabled" must be a bool.'],
+            ['threads', int, '"threads" must be an integer.'],
+            ['hash', int, '"hash" must be an integer.'],
+            ['pin_cores', bool, '"pin_cores" must be a bool.']]
+
+        for subsection in engine_resources_sections:
+            if subsection[0] not in engine_resources_section:
+                continue
+
+            if not isinstance(engine_resources_section[subsection[0]], subsection[1]):
+                raise TypeError(f'`engine_resources` subsection {subsection[2]}')
+
+        return Engine_Resources_Config(engine_resources_section.get('enabled', False),
+                                       engine_resources_section.get('threads', 0),
+                                       engine_resources_section.get('hash', 4096),
+                                       engine_resources_section.get('pin_cores', False))
+
     @staticmethod
     def _get_syzygy_configs(syzygy_section: dict[str, dict[str, Any]]) -> dict[str, Syzygy_Config]:
         syzygy_sections = [
@@ -164,8 +226,11 @@ class Config:
                 if not isinstance(settings[subsection[0]], subsection[1]):
                     raise TypeError(f'`syzygy` `{key}` subsection {subsection[2]}')
 
+            if not isinstance(settings.get('max_open_files', 128), int):
+                raise TypeError(f'`syzygy` `{key}` subsection "max_open_files" must be an integer.')
+
             if not settings['enabled']:
-                syzygy_configs[key] = Syzygy_Config(False, [], 0, False)
+                syzygy_configs[key] = Syzygy_Config(False, [], 0, False, 0)
                 continue
 
             for path in settings['paths']:
@@ -175,7 +240,8 @@ class Config:
             syzygy_configs[key] = Syzygy_Config(settings['enabled'],
                                                 settings['paths'],
                                                 settings['max_pieces'],
-                                                settings['instant_play'])
+                                                settings['instant_play'],
+                                                settings.get('max_open_files', 128))
 
         return syzygy_configs
 
@@ -215,7 +281,7 @@ class Config:
                 raise TypeError(f'`opening_books` subsection {subsection[2]}')
 
         if not config['opening_books']['enabled']:
-            return Opening_Books_Config(False, 0, None, {})
+            return Opening_Books_Config(False, 0, None, None, {})
 
         opening_book_types_sections = [
             ['selection', str, '"selection" must be one of "weighted_random", "uniform_random" or "best_move".'],
@@ -246,6 +312,7 @@ class Config:
         return Opening_Books_Config(config['opening_books']['enabled'],
                                     config['opening_books']['priority'],
                                     config['opening_books'].get('read_learn'),
+                                    config['opening_books'].get('memory_budget'),
                                     books)
 
     @staticmethod
@@ -362,7 +429,7 @@ class Config:
                                   online_egtb_section['timeout'])
 
     @staticmethod
-    def _get_online_moves_config(online_moves_section: dict[str, dict[str, Any]]) -> Online_Moves_Config:
+    def _get_online_moves_config(online_moves_section: dict[str, Any]) -> Online_Moves_Config:
         online_moves_sections = [
             ['opening_explorer', dict, ('"opening_explorer" must be a dictionary '
                                         'with indented keys followed by colons.')],
@@ -378,10 +445,54 @@ class Config:
             if not isinstance(online_moves_section[subsection[0]], subsection[1]):
                 raise TypeError(f'`online_moves` subsection {subsection[2]}')
 
+        if not isinstance(online_moves_section.get('racing', False), bool):
+            raise TypeError('`online_moves` subsection "racing" must be a bool.')
+
+        if not isinstance(online_moves_section.get('prefetch', 0), int):
+            raise TypeError('`online_moves` subsection "prefetch" must be an integer.')
+
+        if not isinstance(online_moves_section.get('cache', {}), dict):
+            raise TypeError('`online_moves` subsection "cache" must be a dictionary '
+                            'with indented keys followed by colons.')
+
         return Online_Moves_Config(Config._get_opening_explorer_config(online_moves_section['opening_explorer']),
                                    Config._get_lichess_cloud_config(online_moves_section['lichess_cloud']),
                                    Config._get_chessdb_config(online_moves_section['chessdb']),
-                                   Config._get_online_egtb_config(online_moves_section['online_egtb']))
+                                   Config._get_online_egtb_config(online_moves_section['online_egtb']),
+                                   online_moves_section.get('racing', False),
+                                   online_moves_section.get('prefetch', 0),
+                                   Config._get_online_cache_config(online_moves_section.get('cache', {})))
+
+    @staticmethod
+    def _get_online_cache_config(cache_section: dict[str, Any]) -> Online_Cache_Config:
+        if not cache_section.get('enabled', False):
+            return Online_Cache_Config(False, '', 0, {})
+
+        cache_sections = [
+            ['enabled', bool, '"enabled" must be a bool.'],
+            ['path', str, '"path" must be a string wrapped in quotes.'],
+            ['max_size', int, '"max_size" must be an integer.'],
+            ['ttl', dict, '"ttl" must be a dictionary with indented keys followed by colons.']]
+
+        for subsection in cache_sections:
+            if subsection[0] not in cache_section:
+                raise RuntimeError('Your config does not have required '
+                                   f'`online_moves` `cache` field `{subsection[0]}`.')
+
+            if not isinstance(cache_section[subsection[0]], subsection[1]):
+                raise TypeError(f'`online_moves` `cache` field {subsection[2]}')
+
+        for source, ttl in cache_section['ttl'].items():
+            if source not in ['opening_explorer', 'lichess_cloud', 'chessdb', 'online_egtb']:
+                raise RuntimeError(f'`online_moves` `cache` `ttl` has unknown source "{source}".')
+
+            if not isinstance(ttl, int | None):
+                raise TypeError(f'`online_moves` `cache` `ttl` "{source}" must be an integer.')
+
+        return Online_Cache_Config(cache_section['enabled'],
+                                   cache_section['path'],
+                                   cache_section['max_size'],
+                                   cache_section['ttl'])
 
     @staticmethod
     def _get_offer_draw_config(offer_draw_section: dict[str, Any]) -> Offer_Draw_Config:
@@ -12,19 +12,36 @@ class Limit_Config:
 @dataclass
 class Engine_Config:
     path: str
+    remote: bool
     ponder: bool
     silence_stderr: bool
+    info_level: Literal['all', 'final']
     move_overhead_multiplier: float
     uci_options: dict[str, Any]
     limits: Limit_Config
 
 
+@dataclass
+class Engine_Pool_Config:
+    size: int
+    max_reuse: int
+
+
+@dataclass
+class Engine_Resources_Config:
+    enabled: bool
+    threads: int
+    hash: int
+    pin_cores: bool
+
+
 @dataclass
 class Syzygy_Config:
     enabled: bool
     paths: list[str]
     max_pieces: int
     instant_play: bool
+    max_open_files: int
 
 
 @dataclass
@@ -46,6 +63,7 @@ class Opening_Books_Config:
     enabled: bool
     priority: int
     read_learn: bool | None
+    memory_budget: int | None
     books: dict[str, Books_Config]
 
 
@@ -99,12 +117,23 @@ class Online_EGTB_Config:
     timeout: int
 
 
+@dataclass
+class Online_Cache_Config:
+    enabled: bool
+    path: str
+    max_size: int
+    ttls: dict[str, int | None]
+
+
 @dataclass
 class Online_Moves_Config:
     opening_explorer: Opening_Explorer_Config
     lichess_cloud: Lichess_Cloud_Config
     chessdb: ChessDB_Config
     online_egtb: Online_EGTB_Config
+    racing: bool
+    prefetch: int
+    cache: Online_Cache_Config
 
 
 @dataclass
@@ -1,11 +1,35 @@
 import asyncio
 import os
 import subprocess
+import sys
+import time
+from typing import Any
 
 import chess
 import chess.engine
+import psutil
 
-from configs import Engine_Config, Limit_Config, Syzygy_Config
+from configs import Engine_Config, Engine_Pool_Config, Engine_Resources_Config, Limit_Config, Syzygy_Config
+from remote_engine import connect_uci
+
+
+class Final_Info_UciProtocol(chess.engine.UciProtocol):
+    def __init__(self) -> None:
+        super().__init__()
+        self.last_info = ''
+        self.final_info = ''
+
+    def line_received(self, line: str) -> None:
+        # Only the raw line is kept, it is parsed once after the search.
+        if line.startswith('info ') and ' pv ' in line and (' multipv ' not in line or ' multipv 1 ' in line):
+            self.last_info = line
+        elif line.startswith('bestmove'):
+            self.final_info = self.last_info
+            self.last_info = ''
+
+    def get_final_info(self, board: chess.Board) -> chess.engine.InfoDict:
+        return chess.engine._parse_uci_info(self.final_info.removeprefix('info '), board,
+                                            chess.engine.INFO_BASIC | chess.engine.INFO_SCORE | chess.engine.INFO_PV)
 
 
 class Engine:
@@ -20,56 +44,105 @@ class Engine:
         self.ponder = ponder
         self.opponent = opponent
         self.limit_config = limit_config
+        self.resource_options: dict[str, int] = {}
+        self.nps: int | None = None
+        self.resources_changed = False
+        self.ponder_board: chess.Board | None = None
+        self.ponder_interrupted = False
+        self.ponder_count = 0
+        self.ponderhit_count = 0
+        self.options: dict[str, Any] | None = None
+        self.cores: list[int] = []
 
     @classmethod
     async def from_config(cls,
                           engine_config: Engine_Config,
                           syzygy_config: Syzygy_Config,
                           opponent: chess.engine.Opponent) -> 'Engine':
-        stderr = subprocess.DEVNULL if engine_config.silence_stderr else None
+        transport, protocol = await cls.start(engine_config)
+        engine = cls(transport, protocol, engine_config.ponder, opponent, engine_config.limits)
+        await engine.configure(engine_config, syzygy_config)
+        await protocol.send_opponent_information(opponent=opponent)
+
+        return engine
 
-        transport, engine = await chess.engine.popen_uci(engine_config.path, stderr=stderr)
+    @staticmethod
+    async def start(engine_config: Engine_Config) -> tuple[asyncio.SubprocessTransport, chess.engine.UciProtocol]:
+        protocol_class = Final_Info_UciProtocol if engine_config.info_level == 'final' else chess.engine.UciProtocol
+        if engine_config.remote:
+            return await connect_uci(engine_config.path, protocol_class)
 
-        await cls._configure_engine(engine, engine_config, syzygy_config)
-        await engine.send_opponent_information(opponent=opponent)
+        stderr = subprocess.DEVNULL if engine_config.silence_stderr else None
+        transport, engine = await protocol_class.popen(engine_config.path, stderr=stderr)
+        try:
+            await engine.initialize()
+        except (chess.engine.EngineError, asyncio.CancelledError):
+            transport.close()
+            raise
 
-        return cls(transport, engine, engine_config.ponder, opponent, engine_config.limits)
+        return transport, engine
 
     @classmethod
-    async def test(cls, engine_config: Engine_Config) -> None:
-        stderr = subprocess.DEVNULL if engine_config.silence_stderr else None
+    async def test(cls, engine_config: Engine_Config) -> tuple[float, float]:
+        start_time = time.perf_counter()
+        transport, protocol = await cls.start(engine_config)
+        started_time = time.perf_counter()
+
+        engine = cls(transport, protocol, False, chess.engine.Opponent(None, None, None, False), engine_config.limits)
+        await engine.configure(engine_config, Syzygy_Config(False, [], 0, False, 0))
+        await protocol.ping()
+        configured_time = time.perf_counter()
 
-        transport, engine = await chess.engine.popen_uci(engine_config.path, stderr=stderr)
-        await cls._configure_engine(engine, engine_config, Syzygy_Config(False, [], 0, False))
-        result = await engine.play(chess.Board(), chess.engine.Limit(time=0.1), info=chess.engine.INFO_ALL)
+        result = await protocol.play(chess.Board(), chess.engine.Limit(time=0.1), info=chess.engine.INFO_ALL)
 
         if not result.move:
             raise RuntimeError('Engine could not make a move!')
 
-        await engine.quit()
+        await protocol.quit()
         transport.close()
 
-    @staticmethod
-    async def _configure_engine(engine: chess.engine.UciProtocol,
-                                engine_config: Engine_Config,
-                                syzygy_config: Syzygy_Config) -> None:
+        return started_time - start_time, configured_time - started_time
+
+    async def configure(self, engine_config: Engine_Config, syzygy_config: Syzygy_Config) -> None:
+        options = self._get_options(engine_config, syzygy_config, self.options is None)
+        applied_options = self.options or {}
+
+        # Only options that differ from the last configuration of this process are sent.
+        changed_options = {name: value for name, value in options.items() if applied_options.get(name) != value}
+        for name in applied_options.keys() - options.keys():
+            changed_options[name] = self.engine.options[name].default
+
+        if changed_options:
+            self.ponder_interrupted = self.ponder_board is not None
+            await self.engine.configure(changed_options)
+
+        self.options = options
+
+    def _get_options(self,
+                     engine_config: Engine_Config,
+                     syzygy_config: Syzygy_Config,
+                     print_ignored: bool) -> dict[str, Any]:
+        options: dict[str, Any] = {}
         for name, value in engine_config.uci_options.items():
             if name.lower() in chess.engine.MANAGED_OPTIONS:
-                print(f'UCI option "{name}" ignored as it is managed by the bot.')
-            elif name in engine.options:
-                await engine.configure({name: value})
-            else:
+                if print_ignored:
+                    print(f'UCI option "{name}" ignored as it is managed by the bot.')
+            elif name in self.engine.options:
+                options[name] = value
+            elif print_ignored:
                 print(f'UCI option "{name}" ignored as it is not supported by the engine.')
 
         if not syzygy_config.enabled:
-            return
+            return options
 
-        if 'SyzygyPath' in engine.options and 'SyzygyPath' not in engine_config.uci_options:
+        if 'SyzygyPath' in self.engine.options and 'SyzygyPath' not in engine_config.uci_options:
             delimiter = ';' if os.name == 'nt' else ':'
-            await engine.configure({'SyzygyPath': delimiter.join(syzygy_config.paths)})
+            options['SyzygyPath'] = delimiter.join(syzygy_config.paths)
 
-        if 'SyzygyProbeLimit' in engine.options and 'SyzygyProbeLimit' not in engine_config.uci_options:
-            await engine.configure({'SyzygyProbeLimit': syzygy_config.max_pieces})
+        if 'SyzygyProbeLimit' in self.engine.options and 'SyzygyProbeLimit' not in engine_config.uci_options:
+            options['SyzygyProbeLimit'] = syzygy_config.max_pieces
+
+        return options
 
     @property
     def name(self) -> str:
@@ -96,21 +169,116 @@ class Engine:
                                        nodes=self.limit_config.nodes)
             ponder = self.ponder
 
-        result = await self.engine.play(board, limit, info=chess.engine.INFO_ALL, ponder=ponder)
+        # The engine continues its ponder search with "ponderhit" when the opponent played the ponder move.
+        ponderhit = self.ponder_board is not None and board.move_stack == self.ponder_board.move_stack
+
+        # Any command before "play" would stop the ponder search, new resources wait for the next miss.
+        if self.resource_options and not ponderhit:
+            await self.apply_resources()
+
+        if self.ponder_board:
+            # A ponder search that any command stopped in between counts as a miss, the engine never got "ponderhit".
+            self.ponder_count += 1
+            if ponderhit and not self.ponder_interrupted:
+                self.ponderhit_count += 1
+            self.ponder_board = None
+
+        # python-chess compares the board of the last search with the pondered board when the next command starts.
+        # A copy keeps our later pushes from turning any other command into a "ponderhit".
+        if isinstance(self.engine, Final_Info_UciProtocol):
+            result = await self.engine.play(board.copy(), limit, ponder=ponder)
+            result.info = self.engine.get_final_info(board)
+        else:
+            result = await self.engine.play(board.copy(), limit, info=chess.engine.INFO_ALL, ponder=ponder)
 
         if not result.move:
             raise RuntimeError('Engine could not make a move!')
 
+        if ponder and result.ponder:
+            self.ponder_board = board.copy()
+            self.ponder_board.push(result.move)
+            self.ponder_board.push(result.ponder)
+            self.ponder_interrupted = False
+
+        if nps := result.info.get('nps'):
+            if self.resources_changed:
+                self.resources_changed = False
+                previous_nps = f'{self.nps:,}' if self.nps else 'unknown'
+                print(f'Engine NPS after resource change: {nps:,} (before: {previous_nps})')
+            self.nps = nps
+
         return result.move, result.info
 
+    def allocate_resources(self, threads: int, hash_: int) -> None:
+        options = {'Threads': threads, 'Hash': hash_}
+        self.resource_options = {name: value for name, value in options.items()
+                                 if name in self.engine.options and self.engine.config.get(name) != value}
+
+    async def apply_resources(self) -> None:
+        changes = ', '.join(f'{name}: {self.engine.config.get(name)} -> {value}'
+                            for name, value in self.resource_options.items())
+        print(f'Engine resources changed. {changes}')
+
+        self.ponder_interrupted = self.ponder_board is not None
+        await self.engine.configure(self.resource_options)
+        self.resource_options = {}
+        self.resources_changed = True
+
+    def pin_cores(self, cores: list[int]) -> None:
+        if cores == self.cores or self.transport.get_pid() < 0:
+            return
+
+        if not self.set_affinity(cores):
+            return
+
+        if self.cores:
+            print(f'Engine cores changed: {self.cores} -> {cores}')
+            self.resources_changed = True
+        self.cores = cores
+
+    def set_affinity(self, cores: list[int]) -> bool:
+        try:
+            process = psutil.Process(self.transport.get_pid())
+            process.cpu_affinity(cores)
+            # Linux sets the affinity per thread, new threads inherit it from the thread that creates them.
+            if sys.platform == 'linux':
+                for thread in process.threads():
+                    os.sched_setaffinity(thread.id, cores)
+        except (psutil.Error, OSError, ValueError) as e:
+            print(f'Engine could not be pinned to cores {cores}: {e}')
+            return False
+
+        return True
+
     async def start_pondering(self, board: chess.Board) -> None:
         if self.ponder:
-            await self.engine.analysis(board)
+            self.ponder_board = None
+            await self.engine.analysis(board, info=chess.engine.INFO_NONE)
 
     async def stop_pondering(self, board: chess.Board) -> None:
         if self.ponder:
             self.ponder = False
-            await self.engine.analysis(board, chess.engine.Limit(time=0.001))
+            self.ponder_board = None
+            await self.engine.analysis(board, chess.engine.Limit(time=0.001), info=chess.engine.INFO_NONE)
+
+    async def new_game(self) -> None:
+        # Stops a running ponder search first, engines must not receive "ucinewgame" while searching.
+        await asyncio.wait_for(self.engine.ping(), 5.0)
+        self.engine.send_line('ucinewgame')
+        await asyncio.wait_for(self.engine.ping(), 5.0)
+        self.ponder_board = None
+
+    def reset_ponder_stats(self) -> None:
+        self.ponder_board = None
+        self.ponder_count = 0
+        self.ponderhit_count = 0
+
+    def format_ponder_stats(self) -> str:
+        if not self.ponder_count:
+            return ''
+
+        ponderhit_rate = self.ponderhit_count / self.ponder_count * 100
+        return f'Ponder hits: {self.ponderhit_count}/{self.ponder_count} ({ponderhit_rate:.0f} %)'
 
     async def close(self) -> None:
         try:
@@ -119,3 +287,269 @@ class Engine:
             print('Engine could not be terminated cleanly.')
 
         self.transport.close()
+
+
+class Resource_Allocator:
+    def __init__(self, engine_resources_config: Engine_Resources_Config) -> None:
+        self.config = engine_resources_config
+        self.process_cores = self._get_process_cores()
+        self.cores = self._reserve_bot_core(self.process_cores) if engine_resources_config.pin_cores else []
+        self.threads = engine_resources_config.threads or len(self.cores) or self._get_available_cores()
+        self.weights: dict[Engine, float] = {}
+        self.maximums: dict[Engine, tuple[int, int]] = {}
+
+    async def add(self, engine: Engine, engine_config: Engine_Config, initial_time_ms: int, increment_ms: int) -> None:
+        if engine_config.remote or (not self.config.enabled and not self.cores):
+            return
+
+        # Estimated game duration in seconds, assuming 40 moves per player.
+        self.weights[engine] = max((initial_time_ms + 40 * increment_ms) / 1000, 1.0)
+        self.maximums[engine] = (self._get_maximum(engine, engine_config, 'Threads'),
+                                 self._get_maximum(engine, engine_config, 'Hash'))
+        self._allocate()
+
+        if engine.resource_options:
+            await engine.apply_resources()
+
+    def unpin(self, engine: Engine) -> None:
+        # New engines inherit the core of the bot's event loop until they get their own.
+        if self.cores and engine.transport.get_pid() >= 0:
+            engine.set_affinity(self.process_cores)
+
+    def unpin_thread(self) -> None:
+        # Initializer for worker threads, which inherit the core of the event loop that creates them.
+        if self.cores and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, self.process_cores)
+
+    def remove(self, engine: Engine) -> None:
+        if engine not in self.weights:
+            return
+
+        del self.weights[engine]
+        del self.maximums[engine]
+        engine.resource_options = {}
+        self._allocate()
+
+    def _allocate(self) -> None:
+        if not self.weights:
+            return
+
+        total_weight = sum(self.weights.values())
+        threads = self._split(self.threads, total_weight)
+        for engine, weight in self.weights.items():
+            max_threads, max_hash = self.maximums[engine]
+            threads[engine] = min(threads[engine], max_threads)
+            if self.config.enabled:
+                hash_ = max(int(self.config.hash * weight / total_weight), 1)
+                engine.allocate_resources(threads[engine], min(hash_, max_hash))
+
+        if self.cores:
+            self._pin(threads if self.config.enabled else self._split(len(self.cores), total_weight))
+
+    def _split(self, total: int, total_weight: float) -> dict[Engine, int]:
+        shares = {engine: total * weight / total_weight for engine, weight in self.weights.items()}
+        parts = {engine: max(int(share), 1) for engine, share in shares.items()}
+
+        spare = max(total - sum(parts.values()), 0)
+        remainders = sorted(shares, key=lambda engine: shares[engine] % 1, reverse=True)
+        for engine in remainders[:spare]:
+            parts[engine] += 1
+
+        return parts
+
+    def _pin(self, core_counts: dict[Engine, int]) -> None:
+        # Consecutive core ranges keep the engines apart. Only with more engines than cores do they have to share.
+        next_core = 0
+        for engine, core_count in core_counts.items():
+            if engine.transport.get_pid() < 0:
+                continue
+
+            core_count = min(core_count, len(self.cores))
+            cores = [self.cores[(next_core + i) % len(self.cores)] for i in range(core_count)]
+            next_core = (next_core + core_count) % len(self.cores)
+            engine.pin_cores(sorted(cores))
+
+    @staticmethod
+    def _get_process_cores() -> list[int]:
+        process = psutil.Process()
+        if not hasattr(process, 'cpu_affinity'):
+            return []
+
+        return sorted(process.cpu_affinity())
+
+    @staticmethod
+    def _reserve_bot_core(cores: list[int]) -> list[int]:
+        if not cores:
+            print('Core pinning is not supported on this platform.')
+            return []
+
+        if len(cores) < 2:
+            print('Core pinning needs at least 2 cores as one is kept for the bot.')
+            return []
+
+        # The engines keep off the first core so that the bot's event loop doesn't compete with them.
+        # Only the event loop thread is pinned, where threads can't be pinned the bot stays unpinned.
+        if hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cores[:1])
+            print(f'Bot pinned to core {cores[0]}, engines share cores {cores[1]}-{cores[-1]}.')
+        else:
+            print(f'Engines share cores {cores[1]}-{cores[-1]}, core {cores[0]} is kept for the bot.')
+        return cores[1:]
+
+    @staticmethod
+    def _get_maximum(engine: Engine, engine_config: Engine_Config, name: str) -> int:
+        if name in engine_config.uci_options:
+            return int(engine_config.uci_options[name])
+
+        if name in engine.engine.options and engine.engine.options[name].max is not None:
+            return engine.engine.options[name].max
+
+        return 1
+
+    @staticmethod
+    def _get_available_cores() -> int:
+        if hasattr(os, 'sched_getaffinity'):
+            return len(os.sched_getaffinity(0))
+
+        return os.cpu_count() or 1
+
+
+class Engine_Pool:
+    def __init__(self,
+                 engine_pool_config: Engine_Pool_Config,
+                 engine_resources_config: Engine_Resources_Config,
+                 engine_configs: dict[str, Engine_Config]) -> None:
+        self.config = engine_pool_config
+        self.engine_configs = engine_configs
+        self.allocator = Resource_Allocator(engine_resources_config)
+        self.idle_engines: dict[str, list[Engine]] = {}
+        self.keys: dict[Engine, str] = {}
+        self.uses: dict[Engine, int] = {}
+        self.warming_tasks: dict[asyncio.Task[None], str] = {}
+
+    async def acquire(self,
+                      engine_key: str,
+                      syzygy_config: Syzygy_Config,
+                      opponent: chess.engine.Opponent,
+                      initial_time_ms: int,
+                      increment_ms: int) -> Engine:
+        engine_config = self.engine_configs[engine_key]
+        if not self.config.size:
+            engine = await Engine.from_config(engine_config, syzygy_config, opponent)
+            self.allocator.unpin(engine)
+            await self.allocator.add(engine, engine_config, initial_time_ms, increment_ms)
+            return engine
+
+        idle_engines = self.idle_engines.setdefault(engine_key, [])
+        while idle_engines:
+            engine = idle_engines.pop()
+            if await self._is_healthy(engine):
+                engine.ponder = engine_config.ponder
+                engine.opponent = opponent
+                engine.reset_ponder_stats()
+                await engine.configure(engine_config, syzygy_config)
+                await engine.engine.send_opponent_information(opponent=opponent)
+                break
+
+            print(f'Replacing unresponsive engine "{engine.name}".')
+            self._discard(engine)
+            engine.transport.close()
+        else:
+            engine = await Engine.from_config(engine_config, syzygy_config, opponent)
+            self.allocator.unpin(engine)
+            self.keys[engine] = engine_key
+            self.uses[engine] = 0
+
+        self.uses[engine] += 1
+        self._warm_up(engine_key, engine_config, syzygy_config)
+        await self.allocator.add(engine, engine_config, initial_time_ms, increment_ms)
+        return engine
+
+    async def release(self, engine: Engine) -> None:
+        self.allocator.remove(engine)
+
+        if engine not in self.keys:
+            await engine.close()
+            return
+
+        idle_engines = self.idle_engines[self.keys[engine]]
+        if self.uses[engine] >= self.config.max_reuse or len(idle_engines) >= self.config.size:
+            self._discard(engine)
+            await engine.close()
+            return
+
+        try:
+            await engine.new_game()
+        except (chess.engine.EngineError, TimeoutError):
+            self._discard(engine)
+            engine.transport.close()
+            return
+
+        idle_engines.append(engine)
+
+    async def close(self) -> None:
+        warming_tasks = list(self.warming_tasks)
+        for warming_task in warming_tasks:
+            warming_task.cancel()
+        await asyncio.gather(*warming_tasks, return_exceptions=True)
+
+        for idle_engines in self.idle_engines.values():
+            for engine in idle_engines:
+                await engine.close()
+
+        self.idle_engines.clear()
+        self.keys.clear()
+        self.uses.clear()
+
+    def _warm_up(self,
+                 key: str,
+                 engine_config: Engine_Config,
+                 syzygy_config: Syzygy_Config) -> None:
+        warming_count = sum(warming_key == key for warming_key in self.warming_tasks.values())
+        for _ in range(self.config.size - len(self.idle_engines[key]) - warming_count):
+            warming_task = asyncio.create_task(self._start_idle_engine(key, engine_config, syzygy_config))
+            self.warming_tasks[warming_task] = key
+            warming_task.add_done_callback(self.warming_tasks.pop)
+
+    async def _start_idle_engine(self,
+                                 key: str,
+                                 engine_config: Engine_Config,
+                                 syzygy_config: Syzygy_Config) -> None:
+        try:
+            transport, protocol = await Engine.start(engine_config)
+        except (chess.engine.EngineError, OSError, TimeoutError) as e:
+            print(f'Engine "{key}" could not be started for the pool: {e}')
+            return
+
+        engine = Engine(transport, protocol, engine_config.ponder, chess.engine.Opponent(None, None, None, False),
+                        engine_config.limits)
+        self.allocator.unpin(engine)
+        try:
+            await engine.configure(engine_config, syzygy_config)
+        except (chess.engine.EngineError, TimeoutError) as e:
+            print(f'Engine "{key}" could not be configured for the pool: {e}')
+            transport.close()
+            return
+        except asyncio.CancelledError:
+            transport.close()
+            raise
+
+        self.keys[engine] = key
+        self.uses[engine] = 0
+        self.idle_engines[key].append(engine)
+
+    def _discard(self, engine: Engine) -> None:
+        del self.keys[engine]
+        del self.uses[engine]
+
+    @staticmethod
+    async def _is_healthy(engine: Engine) -> bool:
+        if engine.transport.get_returncode() is not None:
+            return False
+
+        try:
+            await asyncio.wait_for(engine.engine.ping(), 5.0)
+        except (chess.engine.EngineError, TimeoutError):
+            return False
+
+        return True
@@ -0,0 +1,501 @@
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from itertools import count
+from typing import Any
+
+import chess
+import chess.engine
+from aiohttp import web
+
+SPEEDS = [(29, 'ultraBullet'), (179, 'bullet'), (479, 'blitz'), (1499, 'rapid')]
+
+
+def get_speed(initial: int, increment: int) -> str:
+    duration = initial + 40 * increment
+    return next((speed for limit, speed in SPEEDS if duration <= limit), 'classical')
+
+
+class Fake_Opponent:
+    def __init__(self, strategy: str, delay: float, engine_path: str | None, engine_time: float) -> None:
+        self.strategy = strategy
+        self.delay = delay
+        self.engine_path = engine_path
+        self.engine_time = engine_time
+        self.engine: chess.engine.UciProtocol | None = None
+        self.engine_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        if self.engine_path:
+            _, self.engine = await chess.engine.popen_uci(self.engine_path)
+
+    async def close(self) -> None:
+        if self.engine:
+            await self.engine.quit()
+
+    async def get_move(self, board: chess.Board) -> chess.Move:
+        if self.engine:
+            # A single engine serves all games one search at a time.
+            async with self.engine_lock:
+                result = await self.engine.play(board, chess.engine.Limit(time=self.engine_time))
+            if result.move:
+                return result.move
+
+        await asyncio.sleep(self.delay)
+        if self.strategy == 'first':
+            return min(board.legal_moves, key=lambda move: move.uci())
+
+        return random.choice(list(board.legal_moves))
+
+
+class Fake_Game:
+    def __init__(self, game_id: str, bot: dict[str, Any], opponent: dict[str, Any], bot_color: chess.Color,
+                 initial: int, increment: int, rated: bool) -> None:
+        self.game_id = game_id
+        self.bot = bot
+        self.opponent = opponent
+        self.bot_color = bot_color
+        self.initial = initial
+        self.increment = increment
+        self.rated = rated
+        self.board = chess.Board()
+        self.clocks = {chess.WHITE: initial * 1000.0, chess.BLACK: initial * 1000.0}
+        self.status = 'started'
+        self.winner: str | None = None
+        self.turn_start_time = time.perf_counter()
+        self.bot_moved = asyncio.Event()
+        self.subscribers: list[asyncio.Queue[dict[str, Any] | None]] = []
+
+    @property
+    def is_bot_turn(self) -> bool:
+        return self.board.turn == self.bot_color
+
+    def get_state(self) -> dict[str, Any]:
+        state = {'type': 'gameState',
+                 'moves': ' '.join(move.uci() for move in self.board.move_stack),
+                 'wtime': int(self.clocks[chess.WHITE]),
+                 'btime': int(self.clocks[chess.BLACK]),
+                 'winc': self.increment * 1000,
+                 'binc': self.increment * 1000,
+                 'status': self.status}
+        if self.winner:
+            state['winner'] = self.winner
+        return state
+
+    def get_full(self) -> dict[str, Any]:
+        white, black = (self.bot, self.opponent) if self.bot_color == chess.WHITE else (self.opponent, self.bot)
+        return {'type': 'gameFull',
+                'id': self.game_id,
+                'rated': self.rated,
+                'variant': {'key': 'standard', 'name': 'Standard', 'short': 'Std'},
+                'clock': {'initial': self.initial * 1000, 'increment': self.increment * 1000},
+                'speed': get_speed(self.initial, self.increment),
+                'white': white,
+                'black': black,
+                'initialFen': 'startpos',
+                'state': self.get_state()}
+
+    def push(self, move: chess.Move) -> None:
+        # Like on lichess the clocks only start after both players made their first move.
+        if len(self.board.move_stack) >= 2:
+            elapsed = (time.perf_counter() - self.turn_start_time) * 1000
+            self.clocks[self.board.turn] += self.increment * 1000 - elapsed
+
+        self.board.push(move)
+        self.turn_start_time = time.perf_counter()
+
+    def get_bot_timeout(self) -> float | None:
+        if len(self.board.move_stack) < 2:
+            return
+
+        return max(self.clocks[self.bot_color] / 1000, 0.0)
+
+    def finish(self, status: str, winner: chess.Color | None) -> None:
+        self.status = status
+        self.winner = None if winner is None else chess.COLOR_NAMES[winner]
+
+    def broadcast(self, event: dict[str, Any] | None) -> None:
+        for subscriber in self.subscribers:
+            subscriber.put_nowait(event)
+
+
+class Fake_Lichess:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.username: str = args.username
+        self.games_count: int = args.games
+        self.concurrency: int = args.concurrency
+        self.send_challenges: bool = args.send_challenges
+        self.initial, self.increment = (int(float(part) * factor)
+                                        for part, factor in zip(args.tc.split('+'), [60, 1]))
+        self.max_plies: int = args.max_plies
+        self.latency: float = args.latency / 1000
+        self.jitter: float = args.jitter / 1000
+        self.opponent = Fake_Opponent(args.opponent, args.opponent_delay, args.opponent_engine, args.opponent_time)
+        self.ids = count(1)
+        self.games: dict[str, Fake_Game] = {}
+        self.challenges: dict[str, dict[str, Any]] = {}
+        self.event_subscribers: list[asyncio.Queue[dict[str, Any] | None]] = []
+        self.started_games = 0
+        self.finished_games = 0
+        self.results = {'win': 0, 'draw': 0, 'loss': 0, 'aborted': 0}
+        self.response_times: list[float] = []
+        self.illegal_moves = 0
+        self.requests: dict[str, int] = {}
+        self.game_tasks: set[asyncio.Task[None]] = set()
+        self.all_games_finished = asyncio.Event()
+
+    async def serve(self, host: str, port: int) -> None:
+        runner = web.AppRunner(self.create_app())
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        print(f'Fake lichess on http://{host}:{port} for {self.games_count} game(s), {self.concurrency} at a time.')
+        try:
+            await self.all_games_finished.wait()
+        finally:
+            # The summary is printed by the cleanup, also when the server is interrupted.
+            await runner.cleanup()
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self._inject_latency])
+        app.router.add_get('/api/account', self._get_account)
+        app.router.add_post('/api/token/test', self._test_token)
+        app.router.add_post('/api/bot/account/upgrade', self._ok)
+        app.router.add_get('/api/stream/event', self._stream_events)
+        app.router.add_get('/api/bot/game/stream/{game_id}', self._stream_game)
+        app.router.add_post('/api/bot/game/{game_id}/move/{move}', self._make_move)
+        app.router.add_post('/api/bot/game/{game_id}/abort', self._abort_game)
+        app.router.add_post('/api/bot/game/{game_id}/resign', self._resign_game)
+        app.router.add_post('/api/bot/game/{game_id}/chat', self._ok)
+        app.router.add_post('/api/bot/game/{game_id}/claim-victory', self._ok)
+        app.router.add_post('/api/bot/game/{game_id}/takeback/{answer}', self._ok)
+        app.router.add_post('/api/challenge/{challenge_id}/accept', self._accept_challenge)
+        app.router.add_post('/api/challenge/{challenge_id}/decline', self._decline_challenge)
+        app.router.add_post('/api/challenge/{challenge_id}/cancel', self._ok)
+        app.router.add_post('/api/challenge/{username}', self._create_challenge)
+        app.router.add_get('/api/bot/online', self._get_online_bots)
+        app.router.add_get('/api/users/status', self._get_user_status)
+        app.router.add_route('HEAD', '/api/account', self._ok)
+        app.router.add_get('/api/cloud-eval', self._get_cloud_eval)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    @web.middleware
+    async def _inject_latency(self, request: web.Request, handler: Any) -> web.StreamResponse:
+        route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+        self.requests[route] = self.requests.get(route, 0) + 1
+        if self.latency or self.jitter:
+            await asyncio.sleep(self.latency + random.uniform(0.0, self.jitter))
+        return await handler(request)
+
+    async def _on_startup(self, _app: web.Application) -> None:
+        await self.opponent.start()
+
+    async def _on_cleanup(self, _app: web.Application) -> None:
+        for game_task in self.game_tasks:
+            game_task.cancel()
+        await self.opponent.close()
+        self.print_summary()
+
+    @property
+    def bot(self) -> dict[str, Any]:
+        return {'id': self.username.lower(), 'name': self.username, 'title': 'BOT', 'rating': 2000}
+
+    def _get_opponent(self, number: int) -> dict[str, Any]:
+        name = f'Fake-Opponent-{number % 64 + 1}'
+        return {'id': name.lower(), 'name': name, 'title': 'BOT', 'rating': 2000, 'provisional': False}
+
+    async def _ok(self, _request: web.Request) -> web.Response:
+        return web.json_response({'ok': True})
+
+    async def _get_account(self, _request: web.Request) -> web.Response:
+        perfs = {speed: {'rating': 2000, 'games': 100} for _, speed in SPEEDS[1:]}
+        return web.json_response({'id': self.username.lower(), 'username': self.username, 'title': 'BOT',
+                                  'perfs': perfs})
+
+    async def _test_token(self, request: web.Request) -> web.Response:
+        token = await request.text()
+        return web.json_response({token: {'scopes': 'bot:play,challenge:write', 'userId': self.username.lower()}})
+
+    async def _get_online_bots(self, _request: web.Request) -> web.Response:
+        perfs = {speed: {'rating': 2000, 'games': 100} for _, speed in SPEEDS[1:]}
+        lines = [json.dumps({'id': opponent['id'], 'username': opponent['name'], 'title': 'BOT', 'perfs': perfs})
+                 for opponent in map(self._get_opponent, range(64))]
+        return web.Response(text='\n'.join(lines) + '\n', content_type='application/x-ndjson')
+
+    async def _get_user_status(self, request: web.Request) -> web.Response:
+        return web.json_response([{'id': user_id.lower(), 'name': user_id, 'online': True}
+                                  for user_id in request.query.get('ids', '').split(',')])
+
+    async def _get_cloud_eval(self, _request: web.Request) -> web.Response:
+        return web.json_response({'error': 'No cloud evaluation available for that position'}, status=404)
+
+    async def _stream_events(self, request: web.Request) -> web.StreamResponse:
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        self.event_subscribers.append(queue)
+        for game in self.games.values():
+            if game.status == 'started':
+                queue.put_nowait({'type': 'gameStart', 'game': {'id': game.game_id, 'gameId': game.game_id}})
+        self._send_challenges()
+        try:
+            return await self._stream(request, queue)
+        finally:
+            self.event_subscribers.remove(queue)
+
+    async def _stream_game(self, request: web.Request) -> web.StreamResponse:
+        if not (game := self.games.get(request.match_info['game_id'])):
+            return web.json_response({'error': 'Not found'}, status=404)
+
+        queue: asyncio.Queue[dict[str, Any] | None] = asyncio.Queue()
+        queue.put_nowait(game.get_full())
+        if game.status != 'started':
+            queue.put_nowait(None)
+        game.subscribers.append(queue)
+        try:
+            return await self._stream(request, queue)
+        finally:
+            game.subscribers.remove(queue)
+
+    async def _stream(self, request: web.Request, queue: asyncio.Queue[dict[str, Any] | None]) -> web.StreamResponse:
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), 7.0)
+            except TimeoutError:
+                # Lichess keeps idle streams alive with empty lines.
+                event = {}
+
+            if event is None:
+                break
+
+            try:
+                await response.write(json.dumps(event, separators=(',', ':')).encode() + b'\n' if event else b'\n')
+            except ConnectionResetError:
+                break
+
+        return response
+
+    def _send_event(self, event: dict[str, Any]) -> None:
+        for subscriber in self.event_subscribers:
+            subscriber.put_nowait(event)
+
+    def _send_challenges(self) -> None:
+        if not self.send_challenges or not self.event_subscribers:
+            return
+
+        while (self.started_games + len(self.challenges) < self.games_count
+               and len(self.challenges) + self.started_games - self.finished_games < self.concurrency):
+            challenge_id = f'c{next(self.ids):07}'
+            challenge = {'id': challenge_id,
+                         'status': 'created',
+                         'challenger': self._get_opponent(len(self.challenges) + self.started_games),
+                         'destUser': self.bot,
+                         'variant': {'key': 'standard', 'name': 'Standard', 'short': 'Std'},
+                         'rated': False,
+                         'speed': get_speed(self.initial, self.increment),
+                         'timeControl': {'type': 'clock', 'limit': self.initial, 'increment': self.increment,
+                                         'show': f'{self.initial / 60:g}+{self.increment}'},
+                         'color': 'random',
+                         'finalColor': random.choice(['white', 'black'])}
+            self.challenges[challenge_id] = challenge
+            self._send_event({'type': 'challenge', 'challenge': challenge})
+
+    async def _accept_challenge(self, request: web.Request) -> web.Response:
+        if not (challenge := self.challenges.pop(request.match_info['challenge_id'], None)):
+            return web.json_response({'error': 'Challenge not found'}, status=404)
+
+        # The challenge color is the one of the challenger.
+        self._start_game(challenge['challenger'], chess.BLACK if challenge['finalColor'] == 'white' else chess.WHITE)
+        return web.json_response({'ok': True})
+
+    async def _decline_challenge(self, request: web.Request) -> web.Response:
+        if challenge := self.challenges.pop(request.match_info['challenge_id'], None):
+            reason = (await request.post()).get('reason', 'generic')
+            print(f'Challenge {challenge["id"]} declined: {reason}. Check the challenge section of the bot config.')
+            # Declined challenges count as played, otherwise a misconfigured bot would be challenged forever.
+            self.started_games += 1
+            self.finished_games += 1
+            if self.finished_games >= self.games_count:
+                self.all_games_finished.set()
+        return web.json_response({'ok': True})
+
+    async def _create_challenge(self, request: web.Request) -> web.StreamResponse:
+        data = await request.post()
+        opponent = self._get_opponent(0) | {'id': request.match_info['username'].lower(),
+                                            'name': request.match_info['username']}
+        response = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+        await response.prepare(request)
+
+        if self.started_games >= self.games_count:
+            await response.write(json.dumps({'done': 'declined'}).encode() + b'\n')
+            return response
+
+        challenge_id = f'c{next(self.ids):07}'
+        await response.write(json.dumps({'id': challenge_id}).encode() + b'\n')
+        match data.get('color', 'random'):
+            case 'white':
+                bot_color = chess.WHITE
+            case 'black':
+                bot_color = chess.BLACK
+            case _:
+                bot_color = random.choice(chess.COLORS)
+        self._start_game(opponent, bot_color, int(str(data.get('clock.limit', self.initial))),
+                         int(str(data.get('clock.increment', self.increment))), data.get('rated') == 'true')
+        await response.write(json.dumps({'done': 'accepted'}).encode() + b'\n')
+        return response
+
+    def _start_game(self,
+                    opponent: dict[str, Any],
+                    bot_color: chess.Color,
+                    initial: int | None = None,
+                    increment: int | None = None,
+                    rated: bool = False) -> None:
+        game_id = f'g{next(self.ids):07}'
+        initial = self.initial if initial is None else initial
+        increment = self.increment if increment is None else increment
+        game = Fake_Game(game_id, self.bot, opponent, bot_color, initial, increment, rated)
+        self.games[game_id] = game
+        self.started_games += 1
+
+        game_task = asyncio.create_task(self._play_game(game))
+        self.game_tasks.add(game_task)
+        game_task.add_done_callback(self.game_tasks.discard)
+        self._send_event({'type': 'gameStart', 'game': {'id': game_id, 'gameId': game_id}})
+
+    async def _play_game(self, game: Fake_Game) -> None:
+        while game.status == 'started':
+            if game.is_bot_turn:
+                try:
+                    await asyncio.wait_for(game.bot_moved.wait(), game.get_bot_timeout())
+                except TimeoutError:
+                    game.finish('outoftime', not game.bot_color)
+                    break
+                game.bot_moved.clear()
+            else:
+                game.push(await self.opponent.get_move(game.board))
+                if game.clocks[not game.bot_color] <= 0:
+                    game.finish('outoftime', game.bot_color)
+                    break
+
+            if game.status != 'started':
+                break
+
+            if outcome := game.board.outcome(claim_draw=True):
+                match outcome.termination:
+                    case chess.Termination.CHECKMATE:
+                        game.finish('mate', outcome.winner)
+                    case chess.Termination.STALEMATE:
+                        game.finish('stalemate', None)
+                    case _:
+                        game.finish('draw', None)
+            elif self.max_plies and len(game.board.move_stack) >= self.max_plies:
+                game.finish('draw', None)
+
+            game.broadcast(game.get_state())
+
+        self._finish_game(game)
+
+    async def _make_move(self, request: web.Request) -> web.Response:
+        game = self.games.get(request.match_info['game_id'])
+        if game is None or game.status != 'started':
+            return web.json_response({'error': 'Not your game'}, status=400)
+
+        if not game.is_bot_turn:
+            self.illegal_moves += 1
+            return web.json_response({'error': 'Not your turn, or game already over'}, status=400)
+
+        try:
+            move = game.board.parse_uci(request.match_info['move'])
+        except ValueError:
+            self.illegal_moves += 1
+            return web.json_response({'error': f'Illegal move: {request.match_info["move"]}'}, status=400)
+
+        self.response_times.append(time.perf_counter() - game.turn_start_time)
+        game.push(move)
+        if game.clocks[game.bot_color] <= 0:
+            game.finish('outoftime', not game.bot_color)
+        game.bot_moved.set()
+        return web.json_response({'ok': True})
+
+    async def _abort_game(self, request: web.Request) -> web.Response:
+        game = self.games.get(request.match_info['game_id'])
+        if game is None or game.status != 'started' or len(game.board.move_stack) >= 2:
+            return web.json_response({'error': 'This game cannot be aborted'}, status=400)
+
+        game.finish('aborted', None)
+        game.bot_moved.set()
+        return web.json_response({'ok': True})
+
+    async def _resign_game(self, request: web.Request) -> web.Response:
+        game = self.games.get(request.match_info['game_id'])
+        if game is None or game.status != 'started':
+            return web.json_response({'error': 'This game cannot be resigned'}, status=400)
+
+        game.finish('resign', not game.bot_color)
+        game.bot_moved.set()
+        return web.json_response({'ok': True})
+
+    def _finish_game(self, game: Fake_Game) -> None:
+        game.broadcast(game.get_state())
+        game.broadcast(None)
+
+        if game.status == 'aborted':
+            self.results['aborted'] += 1
+        elif game.winner is None:
+            self.results['draw'] += 1
+        else:
+            self.results['win' if game.winner == chess.COLOR_NAMES[game.bot_color] else 'loss'] += 1
+
+        self.finished_games += 1
+        self._send_event({'type': 'gameFinish', 'game': {'id': game.game_id, 'gameId': game.game_id}})
+        print(f'Game {game.game_id} finished: {game.status} after {len(game.board.move_stack)} plies '
+              f'({self.finished_games}/{self.games_count}).')
+
+        if self.finished_games >= self.games_count:
+            self.all_games_finished.set()
+        else:
+            self._send_challenges()
+
+    def print_summary(self) -> None:
+        print(f'\nGames: {self.finished_games}     Wins: {self.results["win"]}     Draws: {self.results["draw"]}     '
+              f'Losses: {self.results["loss"]}     Aborted: {self.results["aborted"]}     '
+              f'Illegal moves: {self.illegal_moves}')
+        if len(self.response_times) > 1:
+            response_times = sorted(self.response_times)
+            print(f'Bot moves: {len(response_times)}     '
+                  f'Response p50: {response_times[len(response_times) // 2] * 1000:.1f} ms     '
+                  f'p99: {response_times[min(len(response_times) * 99 // 100, len(response_times) - 1)] * 1000:.1f} ms'
+                  f'     Mean: {statistics.fmean(response_times) * 1000:.1f} ms')
+        print('Requests: ' + '     '.join(f'{route}: {requests}' for route, requests in sorted(self.requests.items())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the lichess Bot API. '
+                                     'Set "url" in the bot config to "http://HOST:PORT" to play against it.')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', '-p', type=int, default=8080, help='Port to listen on.')
+    parser.add_argument('--username', default='BotLi', help='Username of the bot account.')
+    parser.add_argument('--games', '-g', type=int, default=10, help='Total number of games.')
+    parser.add_argument('--concurrency', '-c', type=int, default=1,
+                        help='Simultaneous games. The "concurrency" of the bot config must be at least as high.')
+    parser.add_argument('--send-challenges', action=argparse.BooleanOptionalAction, default=True,
+                        help='Challenge the bot. Without, games are only started by its matchmaking.')
+    parser.add_argument('--tc', default='3+2', help='Time control of the challenges as "MINUTES+INCREMENT".')
+    parser.add_argument('--max-plies', type=int, default=0, help='Ends games as draws after this many plies.')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay of every request in milliseconds.')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Additional random delay in milliseconds.')
+    parser.add_argument('--opponent', choices=['random', 'first'], default='random',
+                        help='Move choice of the opponents: random or the first legal move in UCI order.')
+    parser.add_argument('--opponent-delay', type=float, default=0.1, help='Thinking time of the opponents.')
+    parser.add_argument('--opponent-engine', help='UCI engine that plays for all opponents instead.')
+    parser.add_argument('--opponent-time', type=float, default=0.05, help='Search time of the opponent engine.')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(Fake_Lichess(args).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
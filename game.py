@@ -1,19 +1,35 @@
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from api import API
-from botli_dataclasses import Game_Information
+from botli_dataclasses import Game_Information, Game_State
 from chatter import Chatter
 from config import Config
+from engine import Engine_Pool
 from lichess_game import Lichess_Game
+from opening_books import Opening_Books
+from tablebases import Tablebases
 
 
 class Game:
-    def __init__(self, api: API, config: Config, username: str, game_id: str) -> None:
+    def __init__(self,
+                 api: API,
+                 config: Config,
+                 username: str,
+                 game_id: str,
+                 engine_pool: Engine_Pool,
+                 opening_books: Opening_Books,
+                 tablebases: Tablebases,
+                 probe_executor: ThreadPoolExecutor) -> None:
         self.api = api
         self.config = config
         self.username = username
         self.game_id = game_id
+        self.engine_pool = engine_pool
+        self.opening_books = opening_books
+        self.tablebases = tablebases
+        self.probe_executor = probe_executor
 
         self.takeback_count = 0
         self.was_aborted = False
@@ -23,15 +39,18 @@ class Game:
         self.abortion_task: asyncio.Task[None] | None = None
 
     async def run(self) -> None:
-        game_stream_queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        game_stream_queue: asyncio.Queue[Game_State | dict[str, Any]] = asyncio.Queue()
         asyncio.create_task(self.api.get_game_stream(self.game_id, game_stream_queue))
-        info = Game_Information.from_gameFull_event(await game_stream_queue.get())
-        lichess_game = await Lichess_Game.acreate(self.api, self.config, self.username, info)
+        gameFull_event = await game_stream_queue.get()
+        assert isinstance(gameFull_event, dict)
+        info = Game_Information.from_gameFull_event(gameFull_event)
+        lichess_game = await Lichess_Game.acreate(self.api, self.config, self.username, info, self.engine_pool,
+                                                  self.opening_books, self.tablebases, self.probe_executor)
         chatter = Chatter(self.api, self.config, self.username, info, lichess_game)
 
         self._print_game_information(info)
 
-        if info.state['status'] != 'started':
+        if info.state.status != 'started':
             self._print_result_message(info.state, lichess_game, info)
             await chatter.send_goodbyes()
             await lichess_game.close()
@@ -51,18 +70,21 @@ class Game:
         max_takebacks = 0 if opponent_is_bot else self.config.challenge.max_takebacks
 
         while event := await game_stream_queue.get():
-            match event['type']:
-                case 'chatLine':
-                    await chatter.handle_chat_message(event)
-                    continue
-                case 'opponentGone':
-                    if event.get('claimWinInSeconds') == 0:
-                        await self.api.claim_victory(self.game_id)
-                    continue
-                case 'gameFull':
-                    event = event['state']
-
-            if event.get('wtakeback') or event.get('btakeback'):
+            if isinstance(event, dict):
+                match event['type']:
+                    case 'chatLine':
+                        await chatter.handle_chat_message(event)
+                        continue
+                    case 'opponentGone':
+                        if event.get('claimWinInSeconds') == 0:
+                            await self.api.claim_victory(self.game_id)
+                        continue
+                    case 'gameFull':
+                        event = Game_State.from_gameState_event(event['state'])
+                    case _:
+                        continue
+
+            if event.wtakeback or event.btakeback:
                 if self.takeback_count >= max_takebacks:
                     await self.api.handle_takeback(self.game_id, False)
                     continue
@@ -77,7 +99,7 @@ class Game:
 
             has_updated = lichess_game.update(event)
 
-            if event['status'] != 'started':
+            if event.status != 'started':
                 if self.move_task:
                     self.move_task.cancel()
 
@@ -119,10 +141,10 @@ class Game:
         print(f'\n{message}\n{128 * "‾"}')
 
     def _print_result_message(self,
-                              game_state: dict[str, Any],
+                              game_state: Game_State,
                               lichess_game: Lichess_Game,
                               info: Game_Information) -> None:
-        if winner := game_state.get('winner'):
+        if winner := game_state.winner:
             if winner == 'white':
                 message = f'{info.white_name} won'
                 loser = info.black_name
@@ -134,7 +156,7 @@ class Game:
                 white_result = '0'
                 black_result = '1'
 
-            match game_state['status']:
+            match game_state.status:
                 case 'mate':
                     message += ' by checkmate!'
                 case 'outoftime':
@@ -153,7 +175,7 @@ class Game:
             white_result = '½'
             black_result = '½'
 
-            match game_state['status']:
+            match game_state.status:
                 case 'draw':
                     if lichess_game.board.is_fifty_moves():
                         message = 'Game drawn by 50-move rule.'
@@ -168,7 +190,7 @@ class Game:
                 case 'stalemate':
                     message = 'Game drawn by stalemate.'
                 case 'outoftime':
-                    out_of_time_player = info.black_name if game_state['wtime'] else info.white_name
+                    out_of_time_player = info.black_name if game_state.wtime else info.white_name
                     message = f'Game drawn. {out_of_time_player} ran out of time.'
                 case _:
                     self.was_aborted = True
@@ -2,21 +2,36 @@
 import asyncio
 from asyncio import Event, Task
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 from api import API
 from botli_dataclasses import Challenge, Challenge_Request, Tournament, Tournament_Request
 from challenger import Challenger
 from config import Config
+from engine import Engine_Pool
 from game import Game
 from matchmaking import Matchmaking
+from opening_books import Opening_Books
+from tablebases import Tablebases
 
 
 class Game_Manager:
-    def __init__(self, api: API, config: Config, username: str) -> None:
+    def __init__(self,
+                 api: API,
+                 config: Config,
+                 username: str,
+                 engine_pool: Engine_Pool,
+                 opening_books: Opening_Books,
+                 tablebases: Tablebases,
+                 probe_executor: ThreadPoolExecutor) -> None:
         self.api = api
         self.config = config
         self.username = username
+        self.engine_pool = engine_pool
+        self.opening_books = opening_books
+        self.tablebases = tablebases
+        self.probe_executor = probe_executor
 
         self.challenger = Challenger(api)
         self.changed_event = Event()
@@ -239,7 +254,8 @@ class Game_Manager:
             self.tournaments[tournament.id_] = tournament
             print(f'External joined tournament "{tournament.name}" detected.')
 
-        game = Game(self.api, self.config, self.username, game_event['id'])
+        game = Game(self.api, self.config, self.username, game_event['id'],
+                    self.engine_pool, self.opening_books, self.tablebases, self.probe_executor)
         task = asyncio.create_task(game.run())
         task.add_done_callback(self._task_callback)
         self.tasks[task] = game
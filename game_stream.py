@@ -0,0 +1,46 @@
+import json
+import re
+from typing import Any
+
+from botli_dataclasses import Game_State
+
+GAME_STATE_PREFIX = b'{"type":"gameState",'
+MOVES_KEY = b'"moves":"'
+GAME_STATE_FIELD = re.compile(rb'"(wtime|btime|status|winner|wtakeback|btakeback)":("[^"]*"|\d+|true|false)')
+
+
+def decode_game_event(line: bytes) -> Game_State | dict[str, Any]:
+    # Nearly every event of a game is a "gameState", those skip building the full dictionary.
+    if line.startswith(GAME_STATE_PREFIX) and (game_state := _decode_game_state(line)):
+        return game_state
+
+    event = json.loads(line)
+    if event['type'] == 'gameState':
+        return Game_State.from_gameState_event(event)
+
+    return event
+
+
+def _decode_game_state(line: bytes) -> Game_State | None:
+    moves_start = line.find(MOVES_KEY)
+    if moves_start < 0:
+        return
+
+    # UCI moves contain neither quotes nor escapes.
+    moves_start += len(MOVES_KEY)
+    moves_end = line.find(b'"', moves_start)
+    if moves_end < 0:
+        return
+
+    fields = dict(GAME_STATE_FIELD.findall(line, moves_end))
+    if b'wtime' not in fields or b'btime' not in fields or b'status' not in fields:
+        return
+
+    winner = fields.get(b'winner')
+    return Game_State(line[moves_start:moves_end].decode('ascii'),
+                      int(fields[b'wtime']),
+                      int(fields[b'btime']),
+                      fields[b'status'][1:-1].decode('ascii'),
+                      winner[1:-1].decode('ascii') if winner else None,
+                      fields.get(b'wtakeback') == b'true',
+                      fields.get(b'btakeback') == b'true')
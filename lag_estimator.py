@@ -0,0 +1,54 @@
+from collections import deque
+
+MIN_SAMPLES = 5
+# The clock reserve covers the lag of this many upcoming moves.
+RESERVE_MOVES = 10
+
+
+class Lag_Estimator:
+    def __init__(self, window: int = 100) -> None:
+        self.round_trips: deque[float] = deque(maxlen=window)
+        self.clock_deductions: deque[float] = deque(maxlen=window)
+        self.post_latencies: dict[str, deque[float]] = {}
+        self.window = window
+
+    def add_round_trip(self, seconds: float) -> None:
+        self.round_trips.append(seconds)
+
+    def add_clock_deduction(self, seconds: float) -> None:
+        # Lag compensation of the server can make the deduction slightly negative.
+        self.clock_deductions.append(max(seconds, 0.0))
+
+    def add_post_latency(self, lane: str, seconds: float) -> None:
+        self.post_latencies.setdefault(lane, deque(maxlen=self.window)).append(seconds)
+
+    def get_move_overhead(self) -> float | None:
+        if len(self.clock_deductions) < MIN_SAMPLES:
+            return
+
+        lag = self._get_percentile(self.clock_deductions, 95)
+        if self.round_trips:
+            lag = max(lag, self._get_percentile(self.round_trips, 95))
+
+        return RESERVE_MOVES * lag
+
+    def format_stats(self) -> str:
+        stats: list[str] = []
+        if self.round_trips:
+            stats.append(f'RTT p50: {self._get_percentile(self.round_trips, 50) * 1000:.0f} ms     '
+                         f'RTT p99: {self._get_percentile(self.round_trips, 99) * 1000:.0f} ms')
+        if self.clock_deductions:
+            stats.append(f'Lag p50: {self._get_percentile(self.clock_deductions, 50) * 1000:.0f} ms     '
+                         f'Lag p99: {self._get_percentile(self.clock_deductions, 99) * 1000:.0f} ms')
+
+        return '     '.join(stats)
+
+    def format_lane_stats(self) -> str:
+        return '     '.join(f'POST {lane} p50: {self._get_percentile(latencies, 50) * 1000:.0f} ms     '
+                           f'POST {lane} p99: {self._get_percentile(latencies, 99) * 1000:.0f} ms'
+                           for lane, latencies in self.post_latencies.items())
+
+    @staticmethod
+    def _get_percentile(values: deque[float], percentile: int) -> float:
+        sorted_values = sorted(values)
+        return sorted_values[min(len(sorted_values) * percentile // 100, len(sorted_values) - 1)]
@@ -1,26 +1,28 @@
 import asyncio
 import itertools
 import random
-import struct
 import time
-from collections.abc import Awaitable, Callable, Iterable
+from collections import Counter
+from collections.abc import Awaitable, Callable, Coroutine, Hashable
+from concurrent.futures import ThreadPoolExecutor
 from itertools import islice
-from typing import Any, Literal
+from typing import Any, TypeVar
 
 import chess
 import chess.engine
-import chess.gaviota
-import chess.polyglot
-import chess.syzygy
 from chess.variant import find_variant
 
 from api import API
-from botli_dataclasses import (Book_Settings, Game_Information, Gaviota_Result, Lichess_Move, Move_Response,
-                               Syzygy_Result)
+from botli_dataclasses import (Book_Settings, Game_Information, Game_State, Gaviota_Result, Lichess_Move,
+                               Move_Response)
 from config import Config
-from configs import Engine_Config, Syzygy_Config
-from engine import Engine
+from configs import Syzygy_Config
+from engine import Engine, Engine_Pool
 from enums import Variant
+from opening_books import Opening_Books
+from tablebases import Syzygy_Prober, Tablebases, value_to_wdl
+
+T = TypeVar('T')
 
 
 class Lichess_Game:
@@ -32,20 +34,36 @@ class Lichess_Game:
                  board: chess.Board,
                  syzygy_config: Syzygy_Config,
                  engine_key: str,
-                 engine: Engine) -> None:
+                 engine: Engine,
+                 engine_pool: Engine_Pool,
+                 opening_books: Opening_Books,
+                 tablebases: Tablebases,
+                 probe_executor: ThreadPoolExecutor) -> None:
         self.api = api
         self.config = config
         self.game_info = game_info
         self.board = board
+        self.position_counts = self._get_position_counts(board)
+        self.parsed_moves_end = len(game_info.state.moves)
+        self.parsed_ply_count = len(board.move_stack)
+        self.parsed_last_move = game_info.state.moves.rpartition(' ')[2]
+        self.opening_books = opening_books
+        self.tablebases = tablebases
+        self.probe_executor = probe_executor
         self.syzygy_config = syzygy_config
-        self.white_time: float = self.game_info.state['wtime'] / 1000
-        self.black_time: float = self.game_info.state['btime'] / 1000
+        self.white_time: float = self.game_info.state.wtime / 1000
+        self.black_time: float = self.game_info.state.btime / 1000
         self.increment = self.game_info.increment_ms / 1000
         self.is_white = self.game_info.white_name == username
         self.book_settings = self._get_book_settings()
-        self.syzygy_tablebase = self._get_syzygy_tablebase()
-        self.gaviota_tablebase = self._get_gaviota_tablebase()
+        syzygy_tablebase = tablebases.get_syzygy(board)
+        self.syzygy_prober = Syzygy_Prober(syzygy_tablebase) if syzygy_tablebase else None
+        self.gaviota_tablebase = tablebases.gaviota
         self.move_sources = self._get_move_sources()
+        self.online_sources = self._get_online_sources()
+        self.prefetched_requests: dict[tuple[Callable[[chess.Board], Any], str],
+                                       asyncio.Task[dict[str, Any] | None]] = {}
+        self.prefetch_task: asyncio.Task[None] | None = None
 
         self.opening_explorer_counter = 0
         self.out_of_opening_explorer_counter = 0
@@ -53,22 +71,37 @@ class Lichess_Game:
         self.out_of_cloud_counter = 0
         self.chessdb_counter = 0
         self.out_of_chessdb_counter = 0
-        self.move_overhead = self._get_move_overhead(config.engines[engine_key])
+        self.move_overhead_multiplier = config.engines[engine_key].move_overhead_multiplier
+        self.turn_start_time = time.perf_counter()
+        self.turn_start_clock = self.own_time
+        self.think_time: float | None = None
         self.engine = engine
+        self.engine_pool = engine_pool
         self.scores: list[chess.engine.PovScore] = []
         self.last_message = 'No eval available yet.'
         self.last_pv: list[chess.Move] = []
 
     @classmethod
-    async def acreate(cls, api: API, config: Config, username: str, game_info: Game_Information) -> 'Lichess_Game':
+    async def acreate(cls,
+                      api: API,
+                      config: Config,
+                      username: str,
+                      game_info: Game_Information,
+                      engine_pool: Engine_Pool,
+                      opening_books: Opening_Books,
+                      tablebases: Tablebases,
+                      probe_executor: ThreadPoolExecutor) -> 'Lichess_Game':
         board = cls._get_board(game_info)
         is_white = game_info.white_name == username
         engine_key = cls._get_engine_key(config, board, is_white, game_info)
         syzygy_config = cls._get_syzygy_config(config, board)
-        engine = await Engine.from_config(config.engines[engine_key],
-                                          syzygy_config,
-                                          game_info.black_opponent if is_white else game_info.white_opponent)
-        return cls(api, config, username, game_info, board, syzygy_config, engine_key, engine)
+        engine = await engine_pool.acquire(engine_key,
+                                           syzygy_config,
+                                           game_info.black_opponent if is_white else game_info.white_opponent,
+                                           game_info.initial_time_ms,
+                                           game_info.increment_ms)
+        return cls(api, config, username, game_info, board, syzygy_config, engine_key, engine, engine_pool,
+                   opening_books, tablebases, probe_executor)
 
     @staticmethod
     def _get_board(game_info: Game_Information) -> chess.Board:
@@ -80,7 +113,7 @@ class Lichess_Game:
             VariantBoard = find_variant(game_info.variant_name)
             board = VariantBoard()
 
-        for uci_move in game_info.state['moves'].split():
+        for uci_move in game_info.state.moves.split():
             board.push_uci(uci_move)
 
         return board
@@ -133,13 +166,19 @@ class Lichess_Game:
             case 'atomic':
                 return config.syzygy['atomic']
             case _:
-                return Syzygy_Config(False, [], 0, False)
+                return Syzygy_Config(False, [], 0, False, 0)
 
     async def make_move(self) -> Lichess_Move:
-        for move_source in self.move_sources:
-            if move_response := await move_source():
-                break
+        if self.config.online_moves.racing:
+            move_response = await self._race_move_sources()
         else:
+            for move_source in self.move_sources:
+                if move_response := await move_source():
+                    break
+            else:
+                move_response = None
+
+        if move_response is None:
             move, info = await self.engine.make_move(self.board, *self.engine_times)
 
             if 'score' in info:
@@ -149,7 +188,10 @@ class Lichess_Game:
                                           pv=info.get('pv', []),
                                           is_engine_move=len(self.board.move_stack) > 1)
 
-        self.board.push(move_response.move)
+        self._push_move(move_response.move)
+        if len(self.board.move_stack) > 2:
+            self.think_time = time.perf_counter() - self.turn_start_time
+        self._prefetch(move_response)
         if not move_response.is_engine_move:
             await self.engine.start_pondering(self.board)
 
@@ -159,22 +201,32 @@ class Lichess_Game:
 
         return Lichess_Move(move_response.move.uci(), self._offer_draw(move_response), self._resign(move_response))
 
-    def update(self, gameState_event: dict[str, Any]) -> bool:
-        self.white_time = gameState_event['wtime'] / 1000
-        self.black_time = gameState_event['btime'] / 1000
+    def update(self, game_state: Game_State) -> bool:
+        self.white_time = game_state.wtime / 1000
+        self.black_time = game_state.btime / 1000
 
-        moves = gameState_event['moves'].split()
-        if len(moves) > len(self.board.move_stack):
-            self.board.push(chess.Move.from_uci(moves[-1]))
+        if new_moves := self._get_new_moves(game_state.moves):
+            for move in new_moves:
+                self._push_move(move)
+            self.turn_start_time = time.perf_counter()
+            self.turn_start_clock = self.own_time
             return True
 
+        if self.think_time is not None and self.parsed_ply_count == len(self.board.move_stack):
+            # Everything the server deducted beyond our own thinking time is lag.
+            clock_deduction = self.turn_start_clock + self.increment - self.own_time
+            self.api.lag_estimator.add_clock_deduction(clock_deduction - self.think_time)
+            self.think_time = None
+
         return False
 
     async def takeback(self) -> None:
-        self.board.pop()
+        self._cancel_prefetching()
+        self._pop_move()
         if self.is_our_turn:
-            self.board.pop()
+            self._pop_move()
         self.last_pv.clear()
+        self.think_time = None
         await self.start_pondering()
 
     @property
@@ -193,6 +245,13 @@ class Lichess_Game:
     def opponent_time(self) -> float:
         return self.black_time if self.is_white else self.white_time
 
+    @property
+    def move_overhead(self) -> float:
+        if lag_overhead := self.api.lag_estimator.get_move_overhead():
+            return max(lag_overhead * self.move_overhead_multiplier, 0.1)
+
+        return max(self.game_info.initial_time_ms / 60_000 * self.move_overhead_multiplier, 1.0)
+
     @property
     def engine_times(self) -> tuple[float, float, float]:
         if self.is_white:
@@ -214,16 +273,14 @@ class Lichess_Game:
         await self.engine.start_pondering(self.board)
 
     async def close(self) -> None:
-        await self.engine.close()
-
-        for book_reader in self.book_settings.readers.values():
-            book_reader.close()
-
-        if self.syzygy_tablebase:
-            self.syzygy_tablebase.close()
-
-        if self.gaviota_tablebase:
-            self.gaviota_tablebase.close()
+        self._cancel_prefetching()
+        if ponder_stats := self.engine.format_ponder_stats():
+            print(ponder_stats)
+        if lag_stats := self.api.lag_estimator.format_stats():
+            print(lag_stats)
+        if lane_stats := self.api.lag_estimator.format_lane_stats():
+            print(lane_stats)
+        await self.engine_pool.release(self.engine)
 
     def _offer_draw(self, move_response: Move_Response) -> bool:
         if not self.config.offer_draw.enabled:
@@ -276,13 +333,8 @@ class Lichess_Game:
         if self.book_settings.max_depth and self.board.ply() >= self.book_settings.max_depth:
             return
 
-        for name, book_reader in self.book_settings.readers.items():
-            try:
-                entries = list(book_reader.find_all(self.board))
-            except struct.error:
-                print(f'Skipping book "{name}" due to error.')
-                continue
-
+        for name in self.book_settings.names:
+            entries = await self._run_probe(self.opening_books.find_all, name, self.board.copy(stack=False))
             if not entries:
                 continue
 
@@ -302,7 +354,7 @@ class Lichess_Game:
 
             weight = entry.weight / sum(entry.weight for entry in entries) * 100.0
             learn = entry.learn if self.config.opening_books.read_learn else 0
-            name = name if len(self.book_settings.readers) > 1 else ''
+            name = name if len(self.book_settings.names) > 1 else ''
             public_message = f'Book:    {self._format_move(entry.move):14}'
             private_message = f'{self._format_book_info(weight, learn)}     {name}'
             return Move_Response(entry.move, public_message, private_message=private_message)
@@ -318,8 +370,7 @@ class Lichess_Game:
         books_config = self.config.opening_books.books[key]
         return Book_Settings(books_config.selection,
                              books_config.max_depth,
-                             {name: chess.polyglot.open_reader(path)
-                              for name, path in books_config.names.items()})
+                             list(books_config.names))
 
     def _get_book_key(self) -> str | None:
         suffixes: list[str] = []
@@ -353,12 +404,120 @@ class Lichess_Game:
 
         return check_book_key('standard')
 
+    async def _make_online_move(self,
+                                get_request: Callable[[chess.Board], Coroutine[Any, Any, dict[str, Any] | None] | None],
+                                evaluate_response: Callable[[dict[str, Any] | None], Move_Response | None]
+                                ) -> Move_Response | None:
+        if not (request := self._get_request(get_request)):
+            return
+
+        start_time = time.perf_counter()
+        if (response := await request) is None:
+            self._reduce_own_time(time.perf_counter() - start_time)
+
+        return evaluate_response(response)
+
+    async def _race_move_sources(self) -> Move_Response | None:
+        requests: dict[Callable[[], Awaitable[Move_Response | None]], asyncio.Future[dict[str, Any] | None]] = {}
+        race_start_time: float | None = None
+        try:
+            for i, move_source in enumerate(self.move_sources):
+                if move_source not in self.online_sources:
+                    if move_response := await move_source():
+                        return move_response
+
+                    continue
+
+                if race_start_time is None:
+                    get_request, _ = self.online_sources[move_source]
+                    if not (request := self._get_request(get_request)):
+                        continue
+
+                    # From the first online request on, all lower priority requests run alongside it.
+                    race_start_time = time.perf_counter()
+                    requests[move_source] = asyncio.ensure_future(request)
+                    for lower_move_source in self.move_sources[i + 1:]:
+                        if lower_move_source in self.online_sources:
+                            get_lower_request, _ = self.online_sources[lower_move_source]
+                            if lower_request := self._get_request(get_lower_request):
+                                requests[lower_move_source] = asyncio.ensure_future(lower_request)
+
+                if request_task := requests.pop(move_source, None):
+                    _, evaluate_response = self.online_sources[move_source]
+                    if move_response := evaluate_response(await request_task):
+                        return move_response
+        finally:
+            for request_task in requests.values():
+                request_task.cancel()
+
+        if race_start_time is not None:
+            self._reduce_own_time(time.perf_counter() - race_start_time)
+
+    def _get_request(self,
+                     get_request: Callable[[chess.Board], Coroutine[Any, Any, dict[str, Any] | None] | None]
+                     ) -> Awaitable[dict[str, Any] | None] | None:
+        if not (request := get_request(self.board)):
+            return
+
+        if prefetched_request := self.prefetched_requests.pop((get_request, self.board.fen()), None):
+            request.close()
+            return prefetched_request
+
+        return request
+
+    def _prefetch(self, move_response: Move_Response) -> None:
+        self._cancel_prefetching()
+
+        if not self.config.online_moves.prefetch or self.board.is_game_over():
+            return
+
+        self.prefetch_task = asyncio.create_task(self._start_prefetching(self.board.copy(stack=False),
+                                                                         move_response.pv))
+
+    async def _start_prefetching(self, board: chess.Board, pv: list[chess.Move]) -> None:
+        predicted_moves: list[chess.Move] = []
+        if len(pv) > 1:
+            predicted_moves.append(pv[1])
+
+        for name in self.book_settings.names:
+            entries = await self._run_probe(self.opening_books.find_all, name, board)
+            entries.sort(key=lambda entry: entry.weight, reverse=True)
+            predicted_moves.extend(entry.move for entry in entries)
+
+        predicted_moves = [move for move in dict.fromkeys(predicted_moves) if board.is_legal(move)]
+        for move in predicted_moves[:self.config.online_moves.prefetch]:
+            predicted_board = board.copy(stack=False)
+            predicted_board.push(move)
+            for move_source in self.move_sources:
+                if move_source not in self.online_sources:
+                    continue
+
+                get_request, _ = self.online_sources[move_source]
+                if request := get_request(predicted_board):
+                    self.prefetched_requests[(get_request, predicted_board.fen())] = asyncio.create_task(request)
+
+    def _cancel_prefetching(self) -> None:
+        if self.prefetch_task:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+
+        for request_task in self.prefetched_requests.values():
+            request_task.cancel()
+
+        self.prefetched_requests.clear()
+
     async def _make_opening_explorer_move(self) -> Move_Response | None:
+        return await self._make_online_move(self._get_opening_explorer_request,
+                                            self._evaluate_opening_explorer_response)
+
+    def _get_opening_explorer_request(self,
+                                      board: chess.Board
+                                      ) -> Coroutine[Any, Any, dict[str, Any] | None] | None:
         out_of_book = self.out_of_opening_explorer_counter >= 5
         too_deep = (False
                     if self.config.online_moves.opening_explorer.max_depth is None
-                    else self.board.ply() >= self.config.online_moves.opening_explorer.max_depth)
-        out_of_range = self.board.fullmove_number > 25
+                    else board.ply() >= self.config.online_moves.opening_explorer.max_depth)
+        out_of_range = board.fullmove_number > 25
         too_many_moves = (False
                           if self.config.online_moves.opening_explorer.max_moves is None
                           else self.opening_explorer_counter >= self.config.online_moves.opening_explorer.max_moves)
@@ -367,30 +526,34 @@ class Lichess_Game:
         if out_of_book or too_deep or out_of_range or too_many_moves or not has_time:
             return
 
+        # Requests skipped for an unreachable host would count as out of book.
+        if self.api.circuit_breakers['explorer.lichess.ovh'].is_open:
+            return
+
         if self.config.online_moves.opening_explorer.player:
-            color = 'white' if self.board.turn else 'black'
+            color = 'white' if board.turn else 'black'
             username = self.config.online_moves.opening_explorer.player
         elif self.config.online_moves.opening_explorer.anti:
-            color = 'black' if self.board.turn else 'white'
-            username = self.game_info.black_name if self.board.turn else self.game_info.white_name
+            color = 'black' if board.turn else 'white'
+            username = self.game_info.black_name if board.turn else self.game_info.white_name
         else:
-            color = 'white' if self.board.turn else 'black'
-            username = self.game_info.white_name if self.board.turn else self.game_info.black_name
+            color = 'white' if board.turn else 'black'
+            username = self.game_info.white_name if board.turn else self.game_info.black_name
 
         speeds = self.game_info.speed if self.game_info.variant == Variant.STANDARD else None
         modes = 'rated' if self.game_info.rated else None
 
-        start_time = time.perf_counter()
-        response = await self.api.get_opening_explorer(username,
-                                                       self.board.fen(),
-                                                       self.game_info.variant,
-                                                       color,
-                                                       modes,
-                                                       speeds,
-                                                       self.config.online_moves.opening_explorer.timeout)
+        return self.api.get_opening_explorer(username,
+                                             board.fen(),
+                                             self.game_info.variant,
+                                             color,
+                                             modes,
+                                             speeds,
+                                             self.config.online_moves.opening_explorer.timeout)
+
+    def _evaluate_opening_explorer_response(self, response: dict[str, Any] | None) -> Move_Response | None:
         if response is None:
             self.out_of_opening_explorer_counter += 1
-            self._reduce_own_time(time.perf_counter() - start_time)
             return
 
         game_count = response['white'] + response['draws'] + response['black']
@@ -438,10 +601,13 @@ class Lichess_Game:
         return max(moves, key=lambda move: move['performance'])
 
     async def _make_cloud_move(self) -> Move_Response | None:
+        return await self._make_online_move(self._get_cloud_request, self._evaluate_cloud_response)
+
+    def _get_cloud_request(self, board: chess.Board) -> Coroutine[Any, Any, dict[str, Any] | None] | None:
         out_of_book = self.out_of_cloud_counter >= 5
         too_deep = (False
                     if self.config.online_moves.lichess_cloud.max_depth is None
-                    else self.board.ply() >= self.config.online_moves.lichess_cloud.max_depth)
+                    else board.ply() >= self.config.online_moves.lichess_cloud.max_depth)
         too_many_moves = (False
                           if self.config.online_moves.lichess_cloud.max_moves is None
                           else self.cloud_counter >= self.config.online_moves.lichess_cloud.max_moves)
@@ -450,13 +616,17 @@ class Lichess_Game:
         if out_of_book or too_deep or too_many_moves or not has_time:
             return
 
-        start_time = time.perf_counter()
-        response = await self.api.get_cloud_eval(self.board.fen().replace('[', '/').replace(']', ''),
-                                                 self.game_info.variant,
-                                                 self.config.online_moves.lichess_cloud.timeout)
+        # Requests the rate scheduler would skip would count as out of book as well.
+        if self.api.circuit_breakers[self.api.lichess_host].is_open or self.api.rate_scheduler.would_skip('cloud'):
+            return
+
+        return self.api.get_cloud_eval(board.fen().replace('[', '/').replace(']', ''),
+                                       self.game_info.variant,
+                                       self.config.online_moves.lichess_cloud.timeout)
+
+    def _evaluate_cloud_response(self, response: dict[str, Any] | None) -> Move_Response | None:
         if response is None:
             self.out_of_cloud_counter += 1
-            self._reduce_own_time(time.perf_counter() - start_time)
             return
 
         if 'error' in response:
@@ -484,28 +654,34 @@ class Lichess_Game:
         return Move_Response(pv[0], message, pv=pv)
 
     async def _make_chessdb_move(self) -> Move_Response | None:
+        return await self._make_online_move(self._get_chessdb_request, self._evaluate_chessdb_response)
+
+    def _get_chessdb_request(self, board: chess.Board) -> Coroutine[Any, Any, dict[str, Any] | None] | None:
         out_of_book = self.out_of_chessdb_counter >= 5
         too_deep = (False
                     if self.config.online_moves.chessdb.max_depth is None
-                    else self.board.ply() >= self.config.online_moves.chessdb.max_depth)
+                    else board.ply() >= self.config.online_moves.chessdb.max_depth)
         too_many_moves = (False
                           if self.config.online_moves.chessdb.max_moves is None
                           else self.chessdb_counter >= self.config.online_moves.chessdb.max_moves)
         has_time = self._has_time(self.config.online_moves.chessdb.min_time)
-        is_endgame = chess.popcount(self.board.occupied) <= 7
+        is_endgame = chess.popcount(board.occupied) <= 7
 
         if out_of_book or too_deep or too_many_moves or not has_time or is_endgame:
             return
 
-        start_time = time.perf_counter()
-        response = await self.api.get_chessdb_eval(fen := self.board.fen(), self.config.online_moves.chessdb.timeout)
+        if self.api.circuit_breakers['www.chessdb.cn'].is_open:
+            return
+
+        return self.api.get_chessdb_eval(board.fen(), self.config.online_moves.chessdb.timeout)
+
+    def _evaluate_chessdb_response(self, response: dict[str, Any] | None) -> Move_Response | None:
         if response is None:
             self.out_of_chessdb_counter += 1
-            self._reduce_own_time(time.perf_counter() - start_time)
             return
 
         if response['status'] != 'rate limit exceeded':
-            asyncio.create_task(self.api.queue_chessdb(fen))
+            asyncio.create_task(self.api.queue_chessdb(self.board.fen()))
 
         if response['status'] != 'ok':
             self.out_of_chessdb_counter += 1
@@ -540,21 +716,21 @@ class Lichess_Game:
         message = f'ChessDB: {self._format_move(move):14} {self._format_score(pov_score)}     {candidates}'
         return Move_Response(move, message)
 
-    def _probe_gaviota(self, moves: Iterable[chess.Move]) -> Gaviota_Result:
+    def _probe_gaviota(self, board_copy: chess.Board, moves: list[chess.Move]) -> Gaviota_Result:
         assert self.gaviota_tablebase
 
         best_move = chess.Move.null()
         best_wdl = -2
         best_dtm = 1_000_000
-        board_copy = self.board.copy(stack=False)
         for move in moves:
             board_copy.push(move)
 
             if board_copy.is_checkmate():
                 return Gaviota_Result(move, 2, 0)
 
-            dtm = -self.gaviota_tablebase.probe_dtm(board_copy)
-            wdl = self._value_to_wdl(dtm, board_copy.halfmove_clock)
+            with self.tablebases.gaviota_lock:
+                dtm = -self.gaviota_tablebase.probe_dtm(board_copy)
+            wdl = value_to_wdl(dtm, board_copy.halfmove_clock)
 
             if best_move:
                 if wdl > best_wdl:
@@ -582,7 +758,8 @@ class Lichess_Game:
                     return
 
                 try:
-                    result = self._probe_gaviota(self.board.generate_legal_captures())
+                    result = await self._run_probe(self._probe_gaviota, self.board.copy(stack=False),
+                                                   list(self.board.generate_legal_captures()))
                 except KeyError:
                     return
 
@@ -590,7 +767,8 @@ class Lichess_Game:
                     return
             case _:
                 try:
-                    result = self._probe_gaviota(self.board.generate_legal_moves())
+                    result = await self._run_probe(self._probe_gaviota, self.board.copy(stack=False),
+                                                   list(self.board.generate_legal_moves()))
                 except KeyError:
                     return
 
@@ -614,54 +792,17 @@ class Lichess_Game:
         message = f'Gaviota: {self._format_move(result.move):14} {egtb_info}'
         return Move_Response(result.move, message, is_drawish=offer_draw, is_resignable=resign)
 
-    def _probe_syzygy(self, moves: Iterable[chess.Move]) -> Syzygy_Result:
-        assert self.syzygy_tablebase
-
-        best_move = chess.Move.null()
-        best_wdl = -2
-        best_dtz = 1_000_000
-        best_real_dtz = 0
-        board_copy = self.board.copy(stack=False)
-        for move in moves:
-            board_copy.push(move)
-
-            dtz = -self.syzygy_tablebase.probe_dtz(board_copy)
-            wdl = self._value_to_wdl(dtz, board_copy.halfmove_clock)
-
-            real_dtz = dtz
-            if board_copy.halfmove_clock == 0:
-                if wdl < 0:
-                    dtz += 10_000
-                elif wdl > 0:
-                    dtz -= 10_000
-
-            if best_move:
-                if wdl > best_wdl:
-                    best_move = move
-                    best_wdl = wdl
-                    best_dtz = dtz
-                    best_real_dtz = real_dtz
-                elif wdl == best_wdl and dtz < best_dtz:
-                    best_move = move
-                    best_dtz = dtz
-                    best_real_dtz = real_dtz
-            else:
-                best_move = move
-                best_wdl = wdl
-                best_dtz = dtz
-                best_real_dtz = real_dtz
-
-            board_copy.pop()
-
-        return Syzygy_Result(best_move, best_wdl, best_real_dtz)
-
     async def _make_syzygy_move(self) -> Move_Response | None:
+        if not self.syzygy_prober:
+            return
+
         match chess.popcount(self.board.occupied):
             case pieces if pieces > self.syzygy_config.max_pieces + 1 or self._has_mate_score():
                 return
             case pieces if pieces == self.syzygy_config.max_pieces + 1:
                 try:
-                    result = self._probe_syzygy(self.board.generate_legal_captures())
+                    result = await self._run_probe(self.syzygy_prober.probe_root, self.board.copy(stack=False),
+                                                   list(self.board.generate_legal_captures()))
                 except KeyError:
                     return
 
@@ -669,7 +810,8 @@ class Lichess_Game:
                     return
             case _:
                 try:
-                    result = self._probe_syzygy(self.board.generate_legal_moves())
+                    result = await self._run_probe(self.syzygy_prober.probe_root, self.board.copy(stack=False),
+                                                   list(self.board.generate_legal_moves()))
                 except KeyError:
                     return
 
@@ -699,62 +841,35 @@ class Lichess_Game:
         message = f'Syzygy:  {self._format_move(result.move):14} {egtb_info}'
         return Move_Response(result.move, message, is_drawish=offer_draw, is_resignable=resign)
 
-    def _value_to_wdl(self, value: int, halfmove_clock: int) -> Literal[-2, -1, 0, 1, 2]:
-        if value > 0:
-            if value + halfmove_clock <= 100:
-                return 2
-
-            return 1
-
-        if value < 0:
-            if value - halfmove_clock >= -100:
-                return -2
-
-            return -1
-
-        return 0
-
-    def _get_syzygy_tablebase(self) -> chess.syzygy.Tablebase | None:
-        if not (self.syzygy_config.enabled and self.syzygy_config.instant_play):
-            return
-
-        tablebase = chess.syzygy.open_tablebase(self.syzygy_config.paths[0], VariantBoard=type(self.board))
-
-        for path in self.syzygy_config.paths[1:]:
-            tablebase.add_directory(path)
-
-        return tablebase
-
-    def _get_gaviota_tablebase(self) -> chess.gaviota.PythonTablebase | chess.gaviota.NativeTablebase | None:
-        if not self.config.gaviota.enabled:
-            return
-
-        tablebase = chess.gaviota.open_tablebase(self.config.gaviota.paths[0])
-
-        for path in self.config.gaviota.paths[1:]:
-            tablebase.add_directory(path)
-
-        return tablebase
+    async def _run_probe(self, probe: Callable[..., T], *args: Any) -> T:
+        # Tablebase and book probes block on file I/O, so they must not stall the streams of other games.
+        return await asyncio.get_running_loop().run_in_executor(self.probe_executor, probe, *args)
 
     async def _make_egtb_move(self) -> Move_Response | None:
-        max_pieces = 7 if self.board.uci_variant == 'chess' else 6
-        match chess.popcount(self.board.occupied):
+        return await self._make_online_move(self._get_egtb_request, self._evaluate_egtb_response)
+
+    def _get_egtb_request(self, board: chess.Board) -> Coroutine[Any, Any, dict[str, Any] | None] | None:
+        max_pieces = 7 if board.uci_variant == 'chess' else 6
+        match chess.popcount(board.occupied):
             case pieces if pieces > max_pieces + 1:
                 return
             case pieces if pieces == max_pieces + 1:
-                if not any(self.board.generate_legal_captures()):
+                if not any(board.generate_legal_captures()):
                     return
 
         if not self._has_time(self.config.online_moves.online_egtb.min_time) or self._has_mate_score():
             return
 
-        variant = 'standard' if self.board.uci_variant == 'chess' else self.board.uci_variant
+        if self.api.circuit_breakers['tablebase.lichess.ovh'].is_open:
+            return
+
+        variant = 'standard' if board.uci_variant == 'chess' else board.uci_variant
         assert variant
 
-        start_time = time.perf_counter()
-        response = await self.api.get_egtb(self.board.fen(), variant, self.config.online_moves.online_egtb.timeout)
+        return self.api.get_egtb(board.fen(), variant, self.config.online_moves.online_egtb.timeout)
+
+    def _evaluate_egtb_response(self, response: dict[str, Any] | None) -> Move_Response | None:
         if response is None:
-            self._reduce_own_time(time.perf_counter() - start_time)
             return
 
         outcome: str = response['category']
@@ -873,17 +988,17 @@ class Lichess_Game:
 
         opening_explorer_config = self.config.online_moves.opening_explorer
         if opening_explorer_config.enabled:
-            if not opening_explorer_config.only_without_book or not self.book_settings.readers:
+            if not opening_explorer_config.only_without_book or not self.book_settings.names:
                 if self.board.uci_variant == 'chess' or opening_explorer_config.use_for_variants:
                     opening_sources[self._make_opening_explorer_move] = opening_explorer_config.priority
 
         if self.config.online_moves.lichess_cloud.enabled:
-            if not self.config.online_moves.lichess_cloud.only_without_book or not self.book_settings.readers:
+            if not self.config.online_moves.lichess_cloud.only_without_book or not self.book_settings.names:
                 if self.board.uci_variant == 'chess' or self.config.online_moves.lichess_cloud.use_for_variants:
                     opening_sources[self._make_cloud_move] = self.config.online_moves.lichess_cloud.priority
 
         if self.config.online_moves.chessdb.enabled:
-            if not self.config.online_moves.chessdb.only_without_book or not self.book_settings.readers:
+            if not self.config.online_moves.chessdb.only_without_book or not self.book_settings.names:
                 if self.board.uci_variant == 'chess':
                     opening_sources[self._make_chessdb_move] = self.config.online_moves.chessdb.priority
 
@@ -893,8 +1008,14 @@ class Lichess_Game:
 
         return move_sources
 
-    def _get_move_overhead(self, engine_config: Engine_Config) -> float:
-        return max(self.game_info.initial_time_ms / 60_000 * engine_config.move_overhead_multiplier, 1.0)
+    def _get_online_sources(self) -> dict[Callable[[], Awaitable[Move_Response | None]],
+                                          tuple[Callable[[], Coroutine[Any, Any, dict[str, Any] | None] | None],
+                                                Callable[[dict[str, Any] | None], Move_Response | None]]]:
+        return {self._make_opening_explorer_move: (self._get_opening_explorer_request,
+                                                   self._evaluate_opening_explorer_response),
+                self._make_cloud_move: (self._get_cloud_request, self._evaluate_cloud_response),
+                self._make_chessdb_move: (self._get_chessdb_request, self._evaluate_chessdb_response),
+                self._make_egtb_move: (self._get_egtb_request, self._evaluate_egtb_response)}
 
     def _has_time(self, min_time: float) -> bool:
         if len(self.board.move_stack) < 2:
@@ -915,9 +1036,61 @@ class Lichess_Game:
             self.black_time -= seconds
 
     def _is_repetition(self, move: chess.Move) -> bool:
-        board = self.board.copy()
+        board = self.board.copy(stack=False)
         board.push(move)
-        return board.is_repetition(count=2)
+        return self.position_counts[board._transposition_key()] > 0
+
+    def _get_new_moves(self, moves: str) -> list[chess.Move]:
+        # Only the part of the move string added since the last update is split, as long as the parsed part ends
+        # where it did before. Takebacks and unexpected move strings need a full resync.
+        end = self.parsed_moves_end
+        if (self.parsed_ply_count <= len(self.board.move_stack)
+                and moves.startswith(self.parsed_last_move, end - len(self.parsed_last_move))
+                and moves[end:end + 1] in ('', ' ')):
+            ply_count = self.parsed_ply_count
+            uci_moves = moves[end:].split()
+        else:
+            ply_count = 0
+            uci_moves = moves.split()
+
+        self.parsed_moves_end = len(moves)
+        self.parsed_ply_count = ply_count + len(uci_moves)
+        if uci_moves:
+            self.parsed_last_move = uci_moves[-1]
+        elif not self.parsed_ply_count:
+            self.parsed_last_move = ''
+
+        # The board can be ahead by our own move, moves on both must agree.
+        new_moves = [chess.Move.from_uci(uci_move) for uci_move in uci_moves]
+        board_moves = self.board.move_stack[ply_count:]
+        matching_count = 0
+        for new_move, board_move in zip(new_moves, board_moves):
+            if new_move != board_move:
+                print('Board does not match the moves of the game. Resynchronizing ...')
+                for _ in range(len(board_moves) - matching_count):
+                    self._pop_move()
+                break
+            matching_count += 1
+
+        return new_moves[matching_count:]
+
+    def _push_move(self, move: chess.Move) -> None:
+        self.board.push(move)
+        self.position_counts[self.board._transposition_key()] += 1
+
+    def _pop_move(self) -> None:
+        self.position_counts[self.board._transposition_key()] -= 1
+        self.board.pop()
+
+    @staticmethod
+    def _get_position_counts(board: chess.Board) -> Counter[Hashable]:
+        replay_board = board.root()
+        position_counts: Counter[Hashable] = Counter([replay_board._transposition_key()])
+        for move in board.move_stack:
+            replay_board.push(move)
+            position_counts[replay_board._transposition_key()] += 1
+
+        return position_counts
 
     def _has_mate_score(self) -> bool:
         if not self.scores:
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from configs import Online_Cache_Config
+
+# Hits whose access times are written together instead of updating the database on every hit.
+ACCESS_BATCH_SIZE = 64
+
+
+class Online_Cache:
+    def __init__(self, online_cache_config: Online_Cache_Config) -> None:
+        self.config = online_cache_config
+        self.hits: dict[str, int] = {}
+        self.misses: dict[str, int] = {}
+        self.connection: sqlite3.Connection | None = None
+        self.executor: ThreadPoolExecutor | None = None
+        self.accessed: dict[tuple[str, str], float] = {}
+        self.size = 0
+
+        if not online_cache_config.enabled:
+            return
+
+        # A single thread keeps SQLite off the event loop and serializes all access to the connection.
+        self.executor = ThreadPoolExecutor(1, 'online_cache')
+        self.connection = sqlite3.connect(online_cache_config.path, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses ('
+                                'source TEXT NOT NULL, '
+                                'key TEXT NOT NULL, '
+                                'response TEXT NOT NULL, '
+                                'created REAL NOT NULL, '
+                                'accessed REAL NOT NULL, '
+                                'PRIMARY KEY (source, key))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.size = self.connection.execute('SELECT COALESCE(SUM(LENGTH(CAST(response AS BLOB))), 0) '
+                                            'FROM responses').fetchone()[0]
+
+    async def get(self, source: str, params: dict[str, Any]) -> dict[str, Any] | None:
+        if self.executor is None:
+            return
+
+        response = await asyncio.get_running_loop().run_in_executor(self.executor, self._get, source, params)
+        if response is None:
+            self.misses[source] = self.misses.get(source, 0) + 1
+            return
+
+        self.hits[source] = self.hits.get(source, 0) + 1
+        return response
+
+    async def put(self, source: str, params: dict[str, Any], response: dict[str, Any]) -> None:
+        if self.executor is None:
+            return
+
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._put, source, params, response)
+
+    def format_stats(self) -> str:
+        stats: list[str] = []
+        for source in sorted(self.hits.keys() | self.misses.keys()):
+            hits = self.hits.get(source, 0)
+            misses = self.misses.get(source, 0)
+            stats.append(f'{source}: {hits}/{hits + misses} ({hits / (hits + misses) * 100:.0f} %)')
+
+        return '     '.join(stats)
+
+    async def close(self) -> None:
+        if self.executor is None:
+            return
+
+        if stats := self.format_stats():
+            print(f'Online cache hits: {stats}')
+
+        await asyncio.get_running_loop().run_in_executor(self.executor, self._close)
+        self.executor.shutdown()
+        self.executor = None
+
+    def _get(self, source: str, params: dict[str, Any]) -> dict[str, Any] | None:
+        assert self.connection
+
+        key = self._get_key(source, params)
+        row = self.connection.execute('SELECT response, created FROM responses WHERE source = ? AND key = ?',
+                                      (source, key)).fetchone()
+        now = time.time()
+        if row is None or self._is_expired(source, row[1], now):
+            return
+
+        self.accessed[(source, key)] = now
+        if len(self.accessed) >= ACCESS_BATCH_SIZE:
+            self._write_accessed()
+
+        return json.loads(row[0])
+
+    def _put(self, source: str, params: dict[str, Any], response: dict[str, Any]) -> None:
+        assert self.connection
+
+        key = self._get_key(source, params)
+        response_str = json.dumps(response, separators=(',', ':'))
+        now = time.time()
+        row = self.connection.execute('SELECT LENGTH(CAST(response AS BLOB)) FROM responses '
+                                      'WHERE source = ? AND key = ?', (source, key)).fetchone()
+        self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                (source, key, response_str, now, now))
+        self.accessed.pop((source, key), None)
+        self.size += len(response_str.encode()) - (row[0] if row else 0)
+
+        if self.size > self.config.max_size * 1024 * 1024:
+            self._evict()
+
+    def _close(self) -> None:
+        assert self.connection
+
+        self._write_accessed()
+        self.connection.close()
+        self.connection = None
+
+    def _write_accessed(self) -> None:
+        assert self.connection
+
+        if not self.accessed:
+            return
+
+        self.connection.execute('BEGIN')
+        self.connection.executemany('UPDATE responses SET accessed = ? WHERE source = ? AND key = ?',
+                                    [(accessed, source, key) for (source, key), accessed in self.accessed.items()])
+        self.connection.execute('COMMIT')
+        self.accessed.clear()
+
+    def _evict(self) -> None:
+        assert self.connection
+
+        # Recent hits must be written first to not evict responses that are still in use.
+        self._write_accessed()
+
+        # Evict the least recently used responses down to 90 % so that not every insert has to evict.
+        target_size = self.config.max_size * 1024 * 1024 * 0.9
+        evicted: list[tuple[str, str]] = []
+        for source, key, size in self.connection.execute('SELECT source, key, LENGTH(CAST(response AS BLOB)) '
+                                                         'FROM responses ORDER BY accessed'):
+            if self.size <= target_size:
+                break
+
+            evicted.append((source, key))
+            self.size -= size
+
+        self.connection.execute('BEGIN')
+        self.connection.executemany('DELETE FROM responses WHERE source = ? AND key = ?', evicted)
+        self.connection.execute('COMMIT')
+
+    def _is_expired(self, source: str, created: float, now: float) -> bool:
+        ttl = self.config.ttls.get(source)
+        return ttl is not None and now - created > ttl * 3600
+
+    @staticmethod
+    def _get_key(source: str, params: dict[str, Any]) -> str:
+        key_params = dict(params)
+        if fen := key_params.get('fen'):
+            # Move counters don't change the answer, except the halfmove clock for the tablebase.
+            fields = fen.split()
+            key_params['fen'] = ' '.join(fields[:-1] if source == 'online_egtb' else fields[:-2])
+
+        return json.dumps(key_params, sort_keys=True, separators=(',', ':'))
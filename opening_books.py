@@ -0,0 +1,229 @@
+import argparse
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Iterator
+
+import chess
+import chess.polyglot
+from chess.polyglot import ENTRY_STRUCT, Entry, MemoryMappedReader
+
+from config import Config
+from configs import Opening_Books_Config
+
+COMPILED_BOOK_SUFFIX = '.cbk'
+COMPILED_HEADER_STRUCT = struct.Struct('<8s8sQQ')
+COMPILED_MAGIC = b'BotLiCBK'
+
+
+class Compiled_Book:
+    def __init__(self,
+                 slot_keys: array,
+                 slot_starts: array,
+                 slot_ends: array,
+                 raw_moves: array,
+                 weights: array,
+                 learns: array) -> None:
+        self.slot_keys = slot_keys
+        self.slot_starts = slot_starts
+        self.slot_ends = slot_ends
+        self.raw_moves = raw_moves
+        self.weights = weights
+        self.learns = learns
+        self.mask = len(slot_keys) - 1
+
+    @classmethod
+    def from_reader(cls, reader: MemoryMappedReader) -> 'Compiled_Book':
+        keys = array('Q')
+        starts = array('I')
+        raw_moves = array('H')
+        weights = array('H')
+        learns = array('I')
+
+        # Empty books are not memory mapped.
+        data = b'' if reader.mmap is None else reader.mmap[:]
+
+        previous_key = None
+        for index, (key, raw_move, weight, learn) in enumerate(ENTRY_STRUCT.iter_unpack(data)):
+            if key != previous_key:
+                keys.append(key)
+                starts.append(index)
+                previous_key = key
+
+            raw_moves.append(raw_move)
+            weights.append(weight)
+            learns.append(learn)
+
+        slot_count = 1 << max(2 * len(keys) - 1, 1).bit_length()
+        slot_keys = array('Q', bytes(8 * slot_count))
+        slot_starts = array('I', bytes(4 * slot_count))
+        slot_ends = array('I', bytes(4 * slot_count))
+        mask = slot_count - 1
+
+        for i, key in enumerate(keys):
+            slot = key & mask
+            while slot_ends[slot] and slot_keys[slot] != key:
+                slot = (slot + 1) & mask
+
+            if slot_ends[slot]:
+                # Repeated key in an unsorted book: Keep the first run like the on-disk reader does.
+                continue
+
+            slot_keys[slot] = key
+            slot_starts[slot] = starts[i]
+            slot_ends[slot] = starts[i + 1] if i + 1 < len(starts) else len(raw_moves)
+
+        return cls(slot_keys, slot_starts, slot_ends, raw_moves, weights, learns)
+
+    @classmethod
+    def load(cls, path: str) -> 'Compiled_Book':
+        with open(path, 'rb') as compiled_file:
+            header = compiled_file.read(COMPILED_HEADER_STRUCT.size)
+            magic, byteorder, slot_count, entry_count = COMPILED_HEADER_STRUCT.unpack(header)
+            if magic != COMPILED_MAGIC or byteorder.rstrip(b'\0').decode() != sys.byteorder:
+                raise ValueError('not a compiled book for this platform')
+
+            arrays: list[array] = []
+            for typecode, count in (('Q', slot_count), ('I', slot_count), ('I', slot_count),
+                                    ('H', entry_count), ('H', entry_count), ('I', entry_count)):
+                values = array(typecode)
+                values.fromfile(compiled_file, count)
+                arrays.append(values)
+
+        return cls(*arrays)
+
+    @staticmethod
+    def estimate_size(reader: MemoryMappedReader) -> int:
+        # Lower bound without the slot table, cheap enough to skip books that can never fit.
+        return len(reader) * 8
+
+    @property
+    def size(self) -> int:
+        return sum(values.itemsize * len(values) for values in self._arrays)
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as compiled_file:
+            compiled_file.write(COMPILED_HEADER_STRUCT.pack(COMPILED_MAGIC, sys.byteorder.encode(),
+                                                            len(self.slot_keys), len(self.raw_moves)))
+            for values in self._arrays:
+                values.tofile(compiled_file)
+
+    def __len__(self) -> int:
+        return len(self.raw_moves)
+
+    def find_all(self, board: chess.Board) -> Iterator[Entry]:
+        key = chess.polyglot.zobrist_hash(board)
+        slot = key & self.mask
+        while end := self.slot_ends[slot]:
+            if self.slot_keys[slot] == key:
+                break
+
+            slot = (slot + 1) & self.mask
+        else:
+            return
+
+        for i in range(self.slot_starts[slot], end):
+            if not (weight := self.weights[i]):
+                continue
+
+            raw_move = self.raw_moves[i]
+            to_square = raw_move & 0x3f
+            from_square = (raw_move >> 6) & 0x3f
+            promotion_part = (raw_move >> 12) & 0x7
+            promotion = promotion_part + 1 if promotion_part else None
+
+            if from_square == to_square:
+                promotion, drop = None, promotion
+            else:
+                drop = None
+
+            move = board._from_chess960(board.chess960, from_square, to_square, promotion, drop)
+            if board.is_legal(move):
+                yield Entry(key, raw_move, weight, self.learns[i], move)
+
+    def close(self) -> None:
+        for values in self._arrays:
+            del values[:]
+
+    @property
+    def _arrays(self) -> tuple[array, ...]:
+        return self.slot_keys, self.slot_starts, self.slot_ends, self.raw_moves, self.weights, self.learns
+
+
+class Opening_Books:
+    def __init__(self, opening_books_config: Opening_Books_Config) -> None:
+        self.readers: dict[str, MemoryMappedReader | Compiled_Book] = {}
+
+        if not opening_books_config.enabled:
+            return
+
+        memory_budget = (opening_books_config.memory_budget or 0) * 1024 * 1024
+        readers_by_path: dict[str, MemoryMappedReader | Compiled_Book] = {}
+        for books_config in opening_books_config.books.values():
+            for name, path in books_config.names.items():
+                real_path = os.path.realpath(path)
+                if real_path not in readers_by_path:
+                    reader = chess.polyglot.open_reader(real_path)
+                    if memory_budget and (compiled_book := self._compile(name, real_path, reader, memory_budget)):
+                        memory_budget -= compiled_book.size
+                        reader.close()
+                        readers_by_path[real_path] = compiled_book
+                    else:
+                        readers_by_path[real_path] = reader
+
+                self.readers[name] = readers_by_path[real_path]
+
+    def find_all(self, name: str, board: chess.Board) -> list[Entry]:
+        try:
+            return list(self.readers[name].find_all(board))
+        except struct.error:
+            print(f'Skipping book "{name}" due to error.')
+            return []
+
+    def close(self) -> None:
+        for reader in set(self.readers.values()):
+            reader.close()
+
+        self.readers.clear()
+
+    @staticmethod
+    def _compile(name: str, path: str, reader: MemoryMappedReader, memory_budget: int) -> Compiled_Book | None:
+        if Compiled_Book.estimate_size(reader) > memory_budget:
+            print(f'Book "{name}" exceeds the remaining memory budget, using the on-disk reader.')
+            return
+
+        compiled_book = None
+        compiled_path = path + COMPILED_BOOK_SUFFIX
+        if os.path.isfile(compiled_path) and os.path.getmtime(compiled_path) >= os.path.getmtime(path):
+            try:
+                compiled_book = Compiled_Book.load(compiled_path)
+            except (OSError, EOFError, ValueError) as e:
+                print(f'Ignoring compiled book "{compiled_path}": {e}')
+
+        if compiled_book is None:
+            compiled_book = Compiled_Book.from_reader(reader)
+
+        if compiled_book.size > memory_budget:
+            print(f'Book "{name}" exceeds the remaining memory budget, using the on-disk reader.')
+            compiled_book.close()
+            return
+
+        return compiled_book
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compiles the configured opening books for fast loading.')
+    parser.add_argument('--config', '-c', default='config.yml', help='Path to config.yml.')
+    args = parser.parse_args()
+
+    config = Config.from_yaml(args.config)
+    book_paths = {os.path.realpath(path)
+                  for books_config in config.opening_books.books.values()
+                  for path in books_config.names.values()}
+    for book_path in sorted(book_paths):
+        with chess.polyglot.open_reader(book_path) as book_reader:
+            compiled_book = Compiled_Book.from_reader(book_reader)
+
+        compiled_book.save(book_path + COMPILED_BOOK_SUFFIX)
+        print(f'Compiled "{book_path}": {len(compiled_book)} entries, {compiled_book.size / 1024 / 1024:.1f} MiB.')
@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+# Endpoint class: (requests per second, burst)
+ENDPOINT_CLASSES = {'move': (4.0, 8),
+                    'game': (1.0, 5),
+                    'chat': (1.0, 8),
+                    'challenge': (0.5, 4),
+                    'status': (1.0, 5),
+                    'cloud': (2.0, 4)}
+# Shared by all classes, the total that lichess gets from the bot.
+GLOBAL_RATE = (6.0, 20)
+# Priority requests can't push the global bucket further into debt, so the other classes wait at most a few seconds.
+GLOBAL_MIN_TOKENS = -10.0
+# Never wait, they only use up tokens so that the other classes slow down.
+PRIORITY_CLASSES = {'move', 'game'}
+# Skipped instead of delayed, they must never hold up a game.
+OPPORTUNISTIC_CLASSES = {'chat', 'cloud'}
+# Lichess asks to wait a full minute after a 429.
+RATE_LIMIT_PAUSE = 60.0
+
+
+class Token_Bucket:
+    def __init__(self, rate: float, capacity: int, min_tokens: float = 0.0) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.min_tokens = min_tokens
+        self.tokens = float(capacity)
+        self.update_time = time.monotonic()
+
+    def take(self) -> None:
+        self._refill()
+        self.tokens = max(self.tokens - 1.0, self.min_tokens)
+
+    def get_wait_time(self) -> float:
+        self._refill()
+        return max((1.0 - self.tokens) / self.rate, 0.0)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.update_time) * self.rate, self.capacity)
+        self.update_time = now
+
+
+class Rate_Scheduler:
+    def __init__(self) -> None:
+        self.global_bucket = Token_Bucket(*GLOBAL_RATE, GLOBAL_MIN_TOKENS)
+        self.buckets = {endpoint_class: Token_Bucket(rate, capacity)
+                        for endpoint_class, (rate, capacity) in ENDPOINT_CLASSES.items()}
+        self.locks = {endpoint_class: asyncio.Lock() for endpoint_class in ENDPOINT_CLASSES}
+        self.pause_times: dict[str, float] = {}
+        self.waits: dict[str, int] = {}
+        self.skips: dict[str, int] = {}
+
+    def would_skip(self, endpoint_class: str) -> bool:
+        # Unlike acquire, this neither counts a skipped request nor uses up tokens.
+        if endpoint_class not in OPPORTUNISTIC_CLASSES:
+            return False
+
+        return self.locks[endpoint_class].locked() or self._get_wait_time(endpoint_class) > 0.0
+
+    async def acquire(self, endpoint_class: str) -> bool:
+        if endpoint_class in PRIORITY_CLASSES:
+            self.global_bucket.take()
+            self.buckets[endpoint_class].take()
+            return True
+
+        if endpoint_class in OPPORTUNISTIC_CLASSES:
+            if self.locks[endpoint_class].locked() or self._get_wait_time(endpoint_class):
+                self.skips[endpoint_class] = self.skips.get(endpoint_class, 0) + 1
+                return False
+        elif self.locks[endpoint_class].locked() or self._get_wait_time(endpoint_class):
+            self.waits[endpoint_class] = self.waits.get(endpoint_class, 0) + 1
+
+        # Waiting requests of a class queue up behind each other instead of all waking up for every token.
+        async with self.locks[endpoint_class]:
+            while wait_time := self._get_wait_time(endpoint_class):
+                await asyncio.sleep(wait_time)
+
+            self.global_bucket.take()
+            self.buckets[endpoint_class].take()
+            return True
+
+    def pause(self, endpoint_class: str) -> None:
+        if endpoint_class in PRIORITY_CLASSES:
+            return
+
+        if self.pause_times.get(endpoint_class, 0.0) < time.monotonic():
+            print(f'Rate limited by lichess. Pausing {endpoint_class} requests for {RATE_LIMIT_PAUSE:.0f} seconds.')
+        self.pause_times[endpoint_class] = time.monotonic() + RATE_LIMIT_PAUSE
+
+    def format_stats(self) -> str:
+        stats: list[str] = []
+        for endpoint_class in ENDPOINT_CLASSES:
+            if waits := self.waits.get(endpoint_class):
+                stats.append(f'{endpoint_class}: {waits} delayed')
+            if skips := self.skips.get(endpoint_class):
+                stats.append(f'{endpoint_class}: {skips} skipped')
+
+        return '     '.join(stats)
+
+    def _get_wait_time(self, endpoint_class: str) -> float:
+        pause_time = self.pause_times.get(endpoint_class, 0.0) - time.monotonic()
+        # Priority requests can push the global bucket below zero, which keeps the other classes back.
+        return max(pause_time,
+                   self.global_bucket.get_wait_time(),
+                   self.buckets[endpoint_class].get_wait_time(),
+                   0.0)
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any
+
+import chess.engine
+
+
+def parse_address(address: str) -> tuple[str, str | None, int | None]:
+    if address.startswith('unix://'):
+        return address.removeprefix('unix://'), None, None
+
+    host, _, port = address.removeprefix('tcp://').rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f'Invalid engine address "{address}". Use "tcp://HOST:PORT" or "unix:///PATH".')
+
+    return '', host.strip('[]'), int(port)
+
+
+class Socket_Transport(asyncio.Protocol, asyncio.SubprocessTransport):
+    # Presents a socket connection to python-chess as if it were the pipes of a local engine process.
+    def __init__(self, protocol: chess.engine.UciProtocol) -> None:
+        super().__init__()
+        self.protocol = protocol
+        self.transport: asyncio.Transport | None = None
+        self.returncode: int | None = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self.transport = transport
+        self.protocol.connection_made(self)
+
+    def data_received(self, data: bytes) -> None:
+        self.protocol.pipe_data_received(1, data)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.returncode = 0 if exc is None else 1
+        self.protocol.process_exited()
+        self.protocol.connection_lost(exc)
+
+    def get_pid(self) -> int:
+        return -1
+
+    def get_returncode(self) -> int | None:
+        return self.returncode
+
+    def get_pipe_transport(self, fd: int) -> Any:
+        return self.transport
+
+    def send_signal(self, signal: int) -> None:
+        self.close()
+
+    def terminate(self) -> None:
+        self.close()
+
+    def kill(self) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.transport:
+            self.transport.close()
+
+    def is_closing(self) -> bool:
+        return self.transport is None or self.transport.is_closing()
+
+
+async def connect_uci(address: str,
+                      protocol_class: type[chess.engine.UciProtocol] = chess.engine.UciProtocol
+                      ) -> tuple[Socket_Transport, chess.engine.UciProtocol]:
+    loop = asyncio.get_running_loop()
+    protocol = protocol_class()
+    path, host, port = parse_address(address)
+    if path:
+        _, transport = await loop.create_unix_connection(lambda: Socket_Transport(protocol), path)
+    else:
+        _, transport = await loop.create_connection(lambda: Socket_Transport(protocol), host, port)
+
+    try:
+        await protocol.initialize()
+    except (chess.engine.EngineError, asyncio.CancelledError):
+        transport.close()
+        raise
+
+    return transport, protocol
@@ -0,0 +1,151 @@
+import threading
+from collections.abc import Hashable
+from typing import Literal
+
+import chess
+import chess.gaviota
+import chess.syzygy
+import chess.variant
+
+from botli_dataclasses import Syzygy_Result
+from configs import Gaviota_Config, Syzygy_Config
+
+SYZYGY_VARIANTS: dict[str, type[chess.Board]] = {'standard': chess.Board,
+                                                 'antichess': chess.variant.AntichessBoard,
+                                                 'atomic': chess.variant.AtomicBoard}
+
+
+def value_to_wdl(value: int, halfmove_clock: int) -> Literal[-2, -1, 0, 1, 2]:
+    if value > 0:
+        if value + halfmove_clock <= 100:
+            return 2
+
+        return 1
+
+    if value < 0:
+        if value - halfmove_clock >= -100:
+            return -2
+
+        return -1
+
+    return 0
+
+
+class Tablebases:
+    def __init__(self, syzygy_configs: dict[str, Syzygy_Config], gaviota_config: Gaviota_Config) -> None:
+        self.syzygy: dict[str, chess.syzygy.Tablebase] = {}
+        self.gaviota: chess.gaviota.PythonTablebase | chess.gaviota.NativeTablebase | None = None
+        # Gaviota tablebases keep unsynchronized block caches and file positions.
+        self.gaviota_lock = threading.Lock()
+
+        for key, syzygy_config in syzygy_configs.items():
+            if not (syzygy_config.enabled and syzygy_config.instant_play) or key not in SYZYGY_VARIANTS:
+                continue
+
+            tablebase = chess.syzygy.open_tablebase(syzygy_config.paths[0],
+                                                    max_fds=syzygy_config.max_open_files,
+                                                    VariantBoard=SYZYGY_VARIANTS[key])
+            for path in syzygy_config.paths[1:]:
+                tablebase.add_directory(path)
+
+            self.syzygy[SYZYGY_VARIANTS[key].uci_variant] = tablebase
+
+        if gaviota_config.enabled:
+            self.gaviota = chess.gaviota.open_tablebase(gaviota_config.paths[0])
+
+            for path in gaviota_config.paths[1:]:
+                self.gaviota.add_directory(path)
+
+    def get_syzygy(self, board: chess.Board) -> chess.syzygy.Tablebase | None:
+        return self.syzygy.get(board.uci_variant)
+
+    def close(self) -> None:
+        for tablebase in self.syzygy.values():
+            tablebase.close()
+
+        self.syzygy.clear()
+
+        if self.gaviota:
+            self.gaviota.close()
+            self.gaviota = None
+
+
+class Syzygy_Prober:
+    def __init__(self, tablebase: chess.syzygy.Tablebase) -> None:
+        self.tablebase = tablebase
+        # Memos of a single game, most positions come back on the next moves.
+        self.wdls: dict[Hashable, int] = {}
+        self.dtzs: dict[Hashable, int] = {}
+
+    def probe_root(self, board_copy: chess.Board, moves: list[chess.Move]) -> Syzygy_Result:
+        # DTZ probes are much more expensive than WDL probes, so DTZ is only probed for moves that
+        # can still be the best. Without zeroing the halfmove clock can turn a win into a cursed win
+        # and a loss into a blessed loss, never anything better. Within a WDL class the adjusted DTZ
+        # prefers zeroing wins and non-zeroing losses, which is the second part of the bound.
+        max_scores: dict[chess.Move, tuple[int, bool]] = {}
+        for move in moves:
+            board_copy.push(move)
+            wdl = -self._probe_wdl(board_copy)
+            is_zeroing = board_copy.halfmove_clock == 0
+            if not is_zeroing:
+                wdl = max(wdl, -1)
+
+            max_scores[move] = (wdl, wdl > 0 and is_zeroing or wdl < 0 and not is_zeroing)
+            board_copy.pop()
+
+        best_move = chess.Move.null()
+        best_wdl = -2
+        best_dtz = 1_000_000
+        best_real_dtz = 0
+        for move in sorted(max_scores, key=max_scores.__getitem__, reverse=True):
+            if best_move and max_scores[move] < (best_wdl, best_dtz < 0):
+                break
+
+            board_copy.push(move)
+
+            dtz = -self._probe_dtz(board_copy)
+            wdl = value_to_wdl(dtz, board_copy.halfmove_clock)
+
+            real_dtz = dtz
+            if board_copy.halfmove_clock == 0:
+                if wdl < 0:
+                    dtz += 10_000
+                elif wdl > 0:
+                    dtz -= 10_000
+
+            if best_move:
+                if wdl > best_wdl:
+                    best_move = move
+                    best_wdl = wdl
+                    best_dtz = dtz
+                    best_real_dtz = real_dtz
+                elif wdl == best_wdl and dtz < best_dtz:
+                    best_move = move
+                    best_dtz = dtz
+                    best_real_dtz = real_dtz
+            else:
+                best_move = move
+                best_wdl = wdl
+                best_dtz = dtz
+                best_real_dtz = real_dtz
+
+            board_copy.pop()
+
+        return Syzygy_Result(best_move, best_wdl, best_real_dtz)
+
+    def _probe_wdl(self, board: chess.Board) -> int:
+        key = board._transposition_key()
+        if (wdl := self.wdls.get(key)) is None:
+            wdl = self.wdls[key] = self.tablebase.probe_wdl(board)
+
+        return wdl
+
+    def _probe_dtz(self, board: chess.Board) -> int:
+        key = board._transposition_key()
+        if self.wdls.get(key) == 0:
+            return 0
+
+        if (dtz := self.dtzs.get(key)) is None:
+            dtz = self.dtzs[key] = self.tablebase.probe_dtz(board)
+
+        return dtz
@@ -0,0 +1,87 @@
+import argparse
+import asyncio
+import os
+
+from remote_engine import parse_address
+
+
+class UCI_Server:
+    def __init__(self, engine_path: str, max_engines: int) -> None:
+        self.engine_path = engine_path
+        self.max_engines = max_engines
+        self.engine_count = 0
+
+    async def serve(self, address: str) -> None:
+        path, host, port = parse_address(address)
+        if path:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(self._handle_client, path)
+        else:
+            server = await asyncio.start_server(self._handle_client, host, port)
+
+        print(f'Serving "{self.engine_path}" on {address} for up to {self.max_engines} clients.')
+        async with server:
+            await server.serve_forever()
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = writer.get_extra_info('peername') or 'unix socket'
+        if self.engine_count >= self.max_engines:
+            print(f'Rejected {client}: all {self.max_engines} engines are in use.')
+            writer.close()
+            return
+
+        # Reserved before starting the engine so that concurrent clients can't exceed the limit.
+        self.engine_count += 1
+        try:
+            process = await asyncio.create_subprocess_exec(self.engine_path,
+                                                           stdin=asyncio.subprocess.PIPE,
+                                                           stdout=asyncio.subprocess.PIPE)
+        except OSError as e:
+            self.engine_count -= 1
+            print(f'Failed to start engine for {client}: {e}')
+            writer.close()
+            return
+
+        assert process.stdin and process.stdout
+        print(f'Started engine {process.pid} for {client}.')
+
+        try:
+            # Closing the engine's stdin when the client disconnects makes the engine exit.
+            await asyncio.gather(self._forward(reader, process.stdin), self._forward(process.stdout, writer))
+        finally:
+            try:
+                await asyncio.wait_for(process.wait(), 5.0)
+            except TimeoutError:
+                process.kill()
+                await process.wait()
+
+            self.engine_count -= 1
+            print(f'Engine {process.pid} of {client} exited with code {process.returncode}.')
+
+    @staticmethod
+    async def _forward(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Shares a local UCI engine with bots configured with "remote".')
+    parser.add_argument('engine', help='Path to the engine binary.')
+    parser.add_argument('--listen', '-l', default='tcp://127.0.0.1:9999',
+                        help='"tcp://HOST:PORT" or "unix:///PATH". Only listen on trusted networks, '
+                        'UCI options can make the engine write files.')
+    parser.add_argument('--max-engines', '-m', type=int, default=os.cpu_count() or 1,
+                        help='Maximum number of simultaneously running engines.')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(UCI_Server(args.engine, args.max_engines).serve(args.listen))
+    except KeyboardInterrupt:
+        pass
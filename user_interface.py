@@ -5,17 +5,20 @@ import logging
 import os
 import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from enum import StrEnum
 from typing import TypeVar
 
 from api import API
 from botli_dataclasses import Challenge_Request
 from config import Config
-from engine import Engine
+from engine import Engine, Engine_Pool
 from enums import Challenge_Color, Perf_Type, Variant
 from event_handler import Event_Handler
 from game_manager import Game_Manager
 from logo import LOGO
+from opening_books import Opening_Books
+from tablebases import Tablebases
 
 try:
     import readline
@@ -55,7 +58,14 @@ class User_Interface:
             await self._handle_bot_status(account.get('title'), allow_upgrade)
             await self._test_engines()
 
-            self.game_manager = Game_Manager(self.api, self.config, username)
+            self.engine_pool = Engine_Pool(self.config.engine_pool, self.config.engine_resources,
+                                           self.config.engines)
+            self.opening_books = Opening_Books(self.config.opening_books)
+            self.tablebases = Tablebases(self.config.syzygy, self.config.gaviota)
+            self.probe_executor = ThreadPoolExecutor(self.config.challenge.concurrency, 'probe',
+                                                     initializer=self.engine_pool.allocator.unpin_thread)
+            self.game_manager = Game_Manager(self.api, self.config, username, self.engine_pool,
+                                             self.opening_books, self.tablebases, self.probe_executor)
             self.game_manager_task = asyncio.create_task(self.game_manager.run())
 
             self.event_handler = Event_Handler(self.api, self.config, username, self.game_manager)
@@ -118,8 +128,8 @@ class User_Interface:
     async def _test_engines(self) -> None:
         for engine_name, engine_config in self.config.engines.items():
             print(f'Testing engine "{engine_name}" ... ', end='', flush=True)
-            await Engine.test(engine_config)
-            print('OK')
+            start_time, configuration_time = await Engine.test(engine_config)
+            print(f'OK (start: {start_time * 1000:.0f} ms, configuration: {configuration_time * 1000:.0f} ms)')
 
     async def _handle_command(self, command: list[str]) -> None:
         match command[0]:
@@ -240,6 +250,10 @@ class User_Interface:
         print('Terminating program ...')
         self.event_handler_task.cancel()
         await self.game_manager_task
+        await self.engine_pool.close()
+        self.probe_executor.shutdown(cancel_futures=True)
+        self.opening_books.close()
+        self.tablebases.close()
 
     def _rechallenge(self) -> None:
         last_challenge_event = self.event_handler.last_challenge_event